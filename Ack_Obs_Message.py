@@ -55,6 +55,8 @@ from datetime import datetime
 
 import re
 
+import message_io       # plain, gzip (*.xml.gz) or zstandard (*.xml.zst) message files
+
 get_ipython().system('pip install xmlschema')
 import xmlschema
 
@@ -62,16 +64,10 @@ import xmlschema
 # In[3]:
 
 
-# Define pos_hash function which return a positive hash number
-# For removing random seed which is set at each Python runtime, set-up PYTHONHASHSEED value 
-# %env PYTHONHASHSEED=19531130
+# pos_hash returns a positive hash number: keyed BLAKE2 digest, same at each Python runtime
+# (see hums_message.pos_hash, key set by environment variable S5000F_UID_KEY)
 
-import sys
-def pos_hash(s):
-    h=hash(s)
-    if h < 0:
-        h += sys.maxsize
-    return(str(h))
+from hums_message import pos_hash
 
 
 # ### 1 Get xml file to be processed
@@ -81,7 +77,9 @@ def pos_hash(s):
 
 
 import glob
-list_of_input_files = glob.glob('../Input_folder/*.xml')       # get xml input files to be processed
+list_of_input_files = []                                         # get xml input files to be processed
+for pattern in message_io.MESSAGE_PATTERNS:                      # compressed messages are accepted
+    list_of_input_files += glob.glob(os.path.join('../Input_folder', pattern))
 
 latest_file = min(list_of_input_files, key=os.path.getctime)   # pick the oldest one
 
@@ -92,9 +90,9 @@ print()
 # check that input file has no element <!ENTITY>
 
 nb_entity = 0
-with open(latest_file) as f:
+with message_io.open_message(latest_file) as f:
     for line in f:
-        match = re.search('<!ENTITY', line)
+        match = re.search(b'<!ENTITY', line)
         if match :
             nb_entity = nb_entity + 1 
 
@@ -161,7 +159,7 @@ else:
 # are declared as mandatory in the message XSD schema, therefore their extraction does not
 # any exception 
 
-with open(latest_file, 'r') as fd:
+with message_io.open_message(latest_file) as fd:
     tree = etree.parse(fd)
     root = tree.getroot()
     uid = root.attrib['uid']
@@ -1042,10 +1040,10 @@ for child in trailer:                        # insert children of TRAILER as chi
 # In[ ]:
 
 
-# store message in output xmfile
-message_file = open(msg_uid+'.xml', "wb")
-message_file.write(etree.tostring(message,pretty_print=False,xml_declaration=True, encoding='UTF-8'))
-message_file.close()
+# store message in output xmfile, compressed while written if msg_suffix is '.xml.gz' or '.xml.zst'
+msg_suffix = '.xml'
+with message_io.open_message(msg_uid+msg_suffix, 'wb') as message_file:
+    message_file.write(etree.tostring(message,pretty_print=False,xml_declaration=True, encoding='UTF-8'))
 
 
 # #### to display full content of xml message
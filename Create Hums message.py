@@ -53,16 +53,10 @@ from datetime import datetime
 # In[3]:
 
 
-# Define pos_hash function which return a positive hash number
-# For removing random seed which is set at each Python runtime, set-up PYTHONHASHSEED value 
-# %env PYTHONHASHSEED=19531130
+# pos_hash returns a positive hash number: keyed BLAKE2 digest, same at each Python runtime
+# (see hums_message.pos_hash, key set by environment variable S5000F_UID_KEY)
 
-import sys
-def pos_hash(s):
-    h=hash(s)
-    if h < 0:
-        h += sys.maxsize
-    return(str(h))
+from hums_message import pos_hash
 
 
 # ## 1 - Upload XML data into pandas dataframe
@@ -95,40 +89,26 @@ def pos_hash(s):
 
 
 # read Garmin GPX data and store them in a pandas dataframe
-trekdata = etree.parse('activity_4588550232.xml')
-root = trekdata.getroot()
+# trek points are streamed with etree.iterparse (see module gpx_reader.py): processed
+# elements are cleared, so memory does not grow with the length of the activity
+import gpx_reader
 
-# create namespace dictionary
-ns={'a':'http://www.topografix.com/GPX/1/1',
-    'ns2':'http://www.garmin.com/xmlschemas/GpxExtensions/v3',
-    'ns3':'http://www.garmin.com/xmlschemas/TrackPointExtension/v1'}
+# namespace dictionary
+ns = gpx_reader.ns
 
 
 # In[5]:
 
 
-TimeStamp, Longitude, Latitude, Elevation, Date, Time, HeartRate, Cadence = [],[],[],[],[],[],[],[]
-
-for e in root.findall(".//a:trkpt",ns):
-    TimeStamp.append(e[1].text)
-    Longitude.append(e.attrib['lon'])
-    Latitude.append(e.attrib['lat'])
-    Elevation.append(e[0].text)
-    Date.append(e[1].text[0:10])
-    Time.append(e[1].text[11:19])
-    for ext in e.findall('.//ns3:TrackPointExtension',ns):
-        HeartRate.append(ext[0].text)
-        Cadence.append(ext[1].text)
-        
-#'TimeStamp':pd.to_datetime(TimeStamp), # convert string to datetime
-    
-df=pd.DataFrame({'Longitude': Longitude,
-                 'Latitude': Latitude,
-                 'Elevation': Elevation,
-                 'Date': Date,
-                 'Time': Time,
-                 'HeartRate': HeartRate,
-                 'Cadence': Cadence}, index = TimeStamp) 
+# trek points are stored in typed NumPy columns (see trackpoints.py), converted from text once
+# at parse time; df columns are views of these arrays
+# a whole folder of activities is ingested in parallel with: python bulk_ingest.py <folder> -o <dataset>
+# a single very large GPX file is parsed on all cores with gpx_reader.read_trackpoints_parallel(path)
+# parsed columns are cached in folder .trek_cache (key: file content hash and parser version)
+# Garmin FIT files (*.fit) are read the same way, without conversion to GPX (see fit_reader.py)
+import trek_cache
+trek = trek_cache.load_trackpoints('activity_4588550232.xml')
+df = trek.to_dataframe()
 
 
 # In[6]:
@@ -136,18 +116,26 @@ df=pd.DataFrame({'Longitude': Longitude,
 
 # cell to beactivated to create an EXCEL file 'result.xslx' containing dataframe data 
 # !pip install openpyxl      # A Python library to read/write Excel 2010 xlsx/xlsm files 
-df.to_excel(r'result.xlsx', index = False)
+# rows are streamed (openpyxl write-only mode), sheets are split at the Excel row limit
+import trek_export
+trek_export.to_excel(trek, r'result.xlsx')
+# trek_export.to_parquet(trek, r'result.parquet')    # columnar outputs for downstream tools
+# trek_export.to_feather(trek, r'result.feather')
 
 # hide information 5 minutes after departure time during 953 seconds
-# measurement values set to NaN (not a number) and time values set to NaT (not a time)
-
-trek_start = df.loc[0,'TimeStamp']                        
-hide_start = trek_start + pd.to_timedelta(5, unit='m')
-hide_end = hide_start + pd.to_timedelta(953, unit='s')
-trek_end = df.loc[len(df)-1,'TimeStamp']
-
-df.loc[(df.TimeStamp > hide_start) & (df.TimeStamp < hide_end),
-       ['TimeStamp','Longitude','Latitude','Elevation']]= pd.NaT,np.NaN,np.NaN,np.NaN
+# measurement values set to NaN (not a number); timestamps are kept so that the time index
+# (built once at ingestion, see trackpoints.TimeIndex) stays sorted
+
+trek_start = trek.time_index.start
+hide_start = trek_start + np.timedelta64(5, 'm')
+hide_end = hide_start + np.timedelta64(953, 's')
+trek_end = trek.time_index.end
+
+hidden = trek.time_index.slice(hide_start, hide_end, inclusive=False)   # binary search
+trek.longitude[hidden] = np.nan
+trek.latitude[hidden] = np.nan
+trek.elevation[hidden] = np.nan
+df = trek.to_dataframe()
 # # 2 Creation of message ReportUsageInformation
 # S5000F message have 4 parts:<ul><li>XML schema reference (see [para 2-0](#para20))</li><li>Message header (see [para 2-1](#para21))<li>Message content (see [para 2-2](#para22))<li>Message trailer (see [para 2-3](#para23)</ul>
 
@@ -161,12 +149,12 @@ df.loc[(df.TimeStamp > hide_start) & (df.TimeStamp < hide_end),
 # In[7]:
 
 
-file_header='''
-<n1:isfDataset crud="I" xsi:schemaLocation="http://www.asd-europe.org/s-series/s5000f ../00_XSD_Version_2.0/s5000f_2-0_isfdataset.xsd" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:n1="http://www.asd-europe.org/s-series/s5000f"></n1:isfDataset>
-'''
-xsd=etree.fromstring(file_header)   # create an element xsd from string 'file_header'
-message = etree.ElementTree(xsd)    # create a document tree 'doc' by inserting xsd as element 
-root = message.getroot()            # get root element
+# message parts are created by functions of module hums_message.py
+import hums_message
+
+file_header = hums_message.file_header
+message = hums_message.new_message()   # document tree with element xsd created from string 'file_header'
+root = message.getroot()               # get root element
 
 
 # ## 2-1 Message header <a name="para21"/>
@@ -196,15 +184,7 @@ root = message.getroot()            # get root element
 # output:
 #    (string)     xml           : xml snippet containing header data
 
-def Message_Header(msg_date, msg_time,msg_type,msg_id,msg_status):
-    xml  = "<HEADER>"
-    xml += "<!-- ======================== MESSAGE HEADER ========================== -->"
-    xml += "<msgId><id>" + msg_id + "</id></msgId>"
-    xml += "<msgDate><date>" + msg_date + "</date>"
-    xml += "<time>" + msg_time + "</time></msgDate>"
-    xml += "<msgStatus><state>" + msg_status + "</state></msgStatus>"
-    xml += "<msgType><code>" + msg_type + "</code></msgType></HEADER>"
-    return xml  
+Message_Header = hums_message.Message_Header
 
 
 # <b>c) create message header</b>
@@ -213,7 +193,7 @@ def Message_Header(msg_date, msg_time,msg_type,msg_id,msg_status):
 
 
 now = datetime.now()                                # get message timestamp
-trek_date = df.iloc[0,df.columns.get_loc('Date')]   # get bicycle trek date
+trek_date = str(trek_start.astype('datetime64[D]'))  # get bicycle trek date
 
 # create message header
 msg_date   = now.strftime("%Y-%m-%d")
@@ -221,15 +201,11 @@ msg_time   = now.strftime("%H:%M:%S.0Z")
 msg_type   = 'UC50902'
 msg_id     = 'Bicycle trek chemin de la Simone Aix-en-Provence on '+ str(trek_date)
 msg_status = 'F'
-xml_header = Message_Header(msg_date,msg_time,msg_type,msg_id,msg_status)
+header = {'msg_date': msg_date, 'msg_time': msg_time, 'msg_type': msg_type,
+          'msg_id': msg_id, 'msg_status': msg_status}
 
-header = etree.fromstring(xml_header)     # convert xml string to xml tree HEADER
-for child in header:                      # insert children of HEADER as child of root
-    root.append(child)
-
-# Insert uid attribute in xml schema reference <n1:isfdataset>
-msg_uid = 'msg'+pos_hash(msg_id)
-root.set('uid',msg_uid)
+# insert header children in root and uid attribute in xml schema reference <n1:isfdataset>
+msg_uid = hums_message.add_header(root, **header)
 
 # print(etree.tostring(root))
 
@@ -257,23 +233,11 @@ root.set('uid',msg_uid)
 
 
 uc50902 = etree.SubElement(root,'uc50902')
-serialPV = etree.SubElement(uc50902,'serialPV')
-serialPV_uid = 'serialPV'+pos_hash('ASD/AIA Bike:Mountain Bike:46') 
-serialPV.set('uid',serialPV_uid)                                # uc50902/serialPV/@uid
-
-prodId = etree.SubElement(serialPV,'prodId') 
-prodId_id = etree.SubElement(prodId,'id')
-prodId_id.text='ASD/AIA Bike'                                   # uc50902/serialPV/prodId/id
-
-prodVarId = etree.SubElement(serialPV,'prodVarId')
-prodVarId_id = etree.SubElement(prodVarId,'id')
-prodVarId_id.text='Mountain Bike'                               # uc50902/prodVarId/id
-
-serPVId = etree.SubElement(serialPV,'serPVId')
-serPVId_id = etree.SubElement(serPVId,'id')
-serPVId_id.text='46'                                            # uc50902/serPVId/id
-
-mpoints = etree.SubElement(serialPV,'mpoints')
+serial_pv = {'prod_id': 'ASD/AIA Bike',          # uc50902/serialPV/prodId/id
+             'prod_var_id': 'Mountain Bike',      # uc50902/serialPV/prodVarId/id
+             'ser_pv_id': '46'}                    # uc50902/serialPV/serPVId/id
+# uc50902/serialPV/@uid = 'serialPV' + hash('ASD/AIA Bike:Mountain Bike:46')
+mpoints = hums_message.add_serialPV(uc50902, **serial_pv)
 
 
 # ### 2-2-2 Create measurementPoint (mPoints)
@@ -377,41 +341,31 @@ xml = "".join([xml_lon, xml_lat, xml_ele, xml_cad, xml_hea])
 # In[14]:
 
 
-# mPoint create element <mpoint> as child of element <mpoints>
-def mPoint(mPoint_id_val,df_col_name,unit_name):
-    # mPoint_id is identifier of mPoint to be stored in mPointId/id
-    # df_col is dataframe column containing usage information
-    
-    mPoint = etree.SubElement(mpoints,'mPoint')
-    mPoint_uid = 'mpoint' + pos_hash(mPoint_id_val)
-    mPoint.set('uid',mPoint_uid)
-    mPointId = etree.SubElement(mPoint,'mPointId')
-    mPointId_id = etree.SubElement(mPointId,'id')
-    mPointId_id.text = mPoint_id_val
-      
-    for e in df.iterrows():
-        mPointVal = etree.SubElement(mPoint,'mPointVal')
-        recDate = etree.SubElement(mPointVal,'recDate')
-        date = etree.SubElement(recDate,'date')
-        date.text = e[1]['Date']
-        time = etree.SubElement(recDate,'time')
-        time.text = e[1]['Time']
-        vdtm = etree.SubElement(mPointVal,'vdtm')
-        vdtm.text = 'MEAS'
-        unit = etree.SubElement(mPointVal,'unit')
-        unit.text = unit_name
-        value = etree.SubElement(mPointVal,'value')
-        value.text = e[1][df_col_name]    
+# mPoint(mpoints,mPoint_id_val,dates,times,values,unit_name,recdates) create element <mPoint> as child
+# of element <mpoints>: mPoint_id_val is stored in mPointId/id, then one mPointVal is created for each
+# value (missing values are not reported). All mPointVal elements are built in one batch.
+mPoint = hums_message.mPoint
 
 
 # In[15]:
 
 
-mPoint('BIKE GPS LATITUDE','Latitude','DGR')
-mPoint('BIKE GPS LONGITUDE','Longitude','DGR')
-mPoint('BIKE GPS ELEVATION','Elevation','MR')
-mPoint('CYCLIST HEART RATE','HeartRate','/MIN')
-mPoint('BIKE CADENCE','Cadence','/MIN')
+# heart rate and cadence can be reported on change only (deadband with tolerance and heartbeat,
+# see reporting.py); values which are not reported are set missing and are not written:
+# import reporting; trek = reporting.deadband(trek, {'heart_rate': (2, '60s'), 'cadence': (2, '60s')})
+
+# GPS track can be simplified before writing latitude, longitude and elevation (Douglas-Peucker,
+# tolerance in metres, see reporting.py); the same trek points are kept for the three mPoints:
+# trek = reporting.simplify(trek, 5.0)
+
+# date/time of mPointVal elements are formatted once, shared by all measurement points
+dates, times = trek.date_time_strings()
+recdates = hums_message.format_recdates(dates, times)
+mPoint(mpoints,'BIKE GPS LATITUDE',dates,times,trek.latitude,'DGR',recdates)
+mPoint(mpoints,'BIKE GPS LONGITUDE',dates,times,trek.longitude,'DGR',recdates)
+mPoint(mpoints,'BIKE GPS ELEVATION',dates,times,trek.elevation,'MR',recdates)
+mPoint(mpoints,'CYCLIST HEART RATE',dates,times,trek.heart_rate,'/MIN',recdates)
+mPoint(mpoints,'BIKE CADENCE',dates,times,trek.cadence,'/MIN',recdates)
 
 	<uc50902>
 		<serialPV uid="serialPV7521661216678648323">
@@ -579,18 +533,7 @@ mPoint('BIKE CADENCE','Cadence','/MIN')
 # output:
 #    (string)     xml             : xml snippet containing trailer data
 
-def Message_Trailer(msg_project,msg_sender,msg_receiver,msg_remarks,msg_classif):
-    xml  = "<TRAILER><!-- ======================== MESSAGE TRAILER ========================== -->"
-    xml += "<msgContext><context><projRef><projId><id>" + msg_project + "</id></projId>"
-    xml += "</projRef></context></msgContext>"
-    xml += "<msgPty><ptyType><code>S</code></ptyType><party><persRef><persId><id>" + msg_sender
-    xml += "</id></persId></persRef></party></msgPty>"
-    xml += "<msgPty><ptyType><code>R</code></ptyType><party><persRef><persId><id>" + msg_receiver
-    xml += "</id></persId></persRef></party></msgPty>"
-    xml += "<rmks><rmk><text><descr>" + msg_remarks + "</descr></text></rmk></rmks>"
-    xml += "<secs><sec><secClassDefRef><secClass><name>" + msg_classif
-    xml += "</name></secClass></secClassDefRef></sec></secs></TRAILER>"
-    return xml 
+Message_Trailer = hums_message.Message_Trailer
 
 
 # <b>c) create message trailer</b><br>
@@ -604,20 +547,40 @@ msg_receiver = 'Bernard RAUST (bernard.raust@edxea.com)'
 msg_remarks  = 'Feedback about bicycle trek done on '+ trek_date +' reported on ' + msg_date
 msg_classif  = 'NUC'
 
-xml_trailer = Message_Trailer(msg_date,msg_time,msg_type,msg_id,msg_status)
+trailer = {'msg_project': msg_project, 'msg_sender': msg_sender, 'msg_receiver': msg_receiver,
+           'msg_remarks': msg_remarks, 'msg_classif': msg_classif}
+hums_message.add_trailer(root, **trailer)     # insert children of TRAILER as child of root
 
-trailer = etree.fromstring(xml_trailer)     # convert xml string to xml tree TRAILER
-for child in trailer:                        # insert children of TRAILER as child of root
-    root.append(child)
+# the same message is created in one call with:
+# message = hums_message.build_message(trek, header, trailer, serial_pv)
 
 
 # In[18]:
 
 
 # store message in output xmfile
-message_file = open(msg_uid+'.xml', "wb")
-message_file.write(etree.tostring(message,pretty_print=False,xml_declaration=True, encoding='UTF-8'))
-message_file.close()
+# uids are recorded with a hash of the message input in a registry (see uid_registry.py): an
+# unchanged trek is not generated again and a msg_id reused for another trek is detected with:
+# uid_registry.generate_message(trek, msg_uid+'.xml', header, trailer, serial_pv)
+# a ride uploaded in pieces is appended in place to the message, using the offset index written
+# next to it by the generator (see message_index.py):
+# hums_message.fast_message(trek, msg_uid+'.xml', header, trailer, serial_pv, index=True)
+# message_index.append_message(msg_uid+'.xml', next_piece)
+# and one measurement point is read between two dates without parsing the whole message with:
+# message_index.read_window(msg_uid+'.xml', 'CYCLIST HEART RATE', '2020-02-25 07:00', '2020-02-25 07:10')
+# a name ending with '.xml.gz' or '.xml.zst' writes a compressed message (see message_io.py)
+hums_message.write_message(message, msg_uid+'.xml')
+
+# for long treks, the same file is written incrementally (without building the message tree) with:
+# hums_message.stream_message(trek, msg_uid+'.xml', header, trailer, serial_pv)
+# or, fastest, filled into precompiled byte templates without lxml (verify=True compares the file
+# with the message tree built above):
+# hums_message.fast_message(trek, msg_uid+'.xml', header, trailer, serial_pv, verify=True)
+# multi-day treks are split into several linked messages (bounded by number of mPointVal, file size
+# or time window) written in parallel, see hums_split.py:
+# hums_split.split_messages(trek, 'messages', header, trailer, serial_pv, max_bytes=2**20, window='1D')
+# a rental fleet is reported in one message, one serialPV per bike built in parallel (see hums_fleet.py):
+# hums_fleet.fleet_message({'46': 'activity_4588550232.xml', '47': [...]}, 'fleet.xml', header, trailer)
 
 
 # #### to display full content of xml message
@@ -655,15 +618,14 @@ gmaps.configure(api_key="AI...")  # eDXEA - API google map key
 # In[30]:
 
 
-geo_points = df[['Latitude','Longitude']].apply(tuple, axis=1)
-trek_route = [(float(a),float(b)) for a,b in geo_points]
+trek_route = list(zip(df['Latitude'], df['Longitude']))
 
 
 # In[31]:
 
 
-mean_long = df['Longitude'].map(float).mean()
-mean_lat = df['Latitude'].map(float).mean()
+mean_long = df['Longitude'].mean()
+mean_lat = df['Latitude'].mean()
 
 #mean_lat = 44.069433    # Jumels latitude
 #mean_long = 2.773235  # Jumels longitude
@@ -676,13 +638,13 @@ fig = gmaps.figure(center=(mean_lat, mean_long),
                    display_toolbar=False
                   )
 
-trek = gmaps.Polygon(trek_route,
-                     stroke_color='red',
-                     stroke_weight=2,
-                     fill_color='white',
-                     fill_opacity=0.0)
+trek_polygon = gmaps.Polygon(trek_route,
+                             stroke_color='red',
+                             stroke_weight=2,
+                             fill_color='white',
+                             fill_opacity=0.0)
 
-drawing = gmaps.drawing_layer(features=[trek], show_controls=False)
+drawing = gmaps.drawing_layer(features=[trek_polygon], show_controls=False)
 
 fig.add_layer(drawing)
 fig
@@ -695,41 +657,19 @@ fig
 # In[22]:
 
 
-import math
-
-def getDistance(lat1,lon1,lat2,lon2):
-    # This uses the haversine formula, which remains a good numerical computation,
-    # even at small distances, unlike the Shperical Law of Cosines.
-    # This method has ~0.3% error built in.
-    R = 6371 # Radius of Earth in km
-
-    dLat = math.radians(float(lat2) - float(lat1))
-    dLon = math.radians(float(lon2) - float(lon1))
-    lat1 = math.radians(float(lat1))
-    lat2 = math.radians(float(lat2))
-
+from trackpoints import haversine
 
-    a = math.sin(dLat/2) * math.sin(dLat/2) +         math.cos(lat1) * math.cos(lat2) * math.sin(dLon/2) * math.sin(dLon/2)
-
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-    d = R * c 
-
-    return d
+# getDistance(lat1,lon1,lat2,lon2) uses the haversine formula, which remains a good numerical
+# computation, even at small distances, unlike the Shperical Law of Cosines.
+# This method has ~0.3% error built in. It is computed on whole columns at once (see trackpoints.py).
+getDistance = haversine
 
 
 # In[23]:
 
 
-# create column to store Latitude and Longitude shifted by one second (one row)
-df['Latitude1']=df.Latitude.shift(1)
-df['Longitude1']=df.Longitude.shift(1)
-
-df['Distance']=df.apply(lambda df: getDistance(pd.Series(df['Latitude1']),
-                                               pd.Series(df['Longitude1']),
-                                               pd.Series(df['Latitude']),
-                                               pd.Series(df['Longitude'])),
-                        axis=1)
+# Latitude and Longitude shifted by one second (one row)
+df['Distance'] = getDistance(df.Latitude.shift(1), df.Longitude.shift(1), df.Latitude, df.Longitude)
 
 distance = int(df['Distance'].sum()*1000)
 print(f"Lenght of bicycle trek was {distance} m")
@@ -748,11 +688,10 @@ get_ipython().run_line_magic('matplotlib', 'inline')
 
 
 # Compute timestamp value to have 10 intervals on x axis
-df.index = pd.to_datetime(df.index)                             # convert index value to datetime
-ts_loc = pd.to_datetime(np.linspace(df.index[0].value, 
-                                    df.index[-1].value, 10))    # compute 10 intervals
-ts_loc = ts_loc.round(freq='S')                                 # round tick timestamp to second
-ts_names = ([df.loc[ts_loc[i],'Time'] for i in range(0,10)])    # get time associated to tick place
+ts_pos = trek.time_index.nearest(np.linspace(trek.timestamp[0],
+                                             trek.timestamp[-1], 10).astype(np.int64))   # 10 intervals
+ts_loc = df.index[ts_pos]                                        # tick timestamp of nearest trek point
+ts_names = df['Time'].iloc[ts_pos].tolist()                      # get time associated to tick place
 
 fig, ax = plt.subplots(figsize=(20, 5))
 
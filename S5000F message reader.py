@@ -14,9 +14,14 @@ get_ipython().system('ipython nbconvert --to python *.ipynb')
 
 import glob
 import os
-list_of_input_files = glob.glob('../Input_folder/*.xml')       # get xml input files to be processed
+import message_io
+list_of_input_files = []                                         # get xml input files to be processed
+for pattern in message_io.MESSAGE_PATTERNS:                      # compressed messages are accepted
+    list_of_input_files += glob.glob(os.path.join('../Input_folder', pattern))
 
 latest_file = min(list_of_input_files, key=os.path.getctime)   # pick the oldest one
+# headers of all messages of a folder tree are extracted in parallel into CSV or Parquet with:
+# python batch_headers.py ../Input_folder -o headers.csv   (see batch_headers.py)
 
 pathname,filename = os.path.split(latest_file)
 print(f"'{filename}'")
@@ -26,13 +31,14 @@ print()
 # In[2]:
 
 
-import lxml.etree as etree
 import datetime as dt
 import numpy as np
 import pandas as pd
 import re
 import os
 
+from message_header import read_header
+
 __author__ = "Bernard Raust"
 __credits__ = ["Bernard Raust"]
 __version__ = "1.0.0"
@@ -43,45 +49,27 @@ __status__ = "Development"
 class Header():
     '''
     Extract header and trailer information of a S5000F message:
-    Input: Path of message xml file
+    Inputs:
+        ** path: Path of message xml file, plain or compressed (gzip or zstandard, see message_io.py)
+        ** fast: if True, message content is not parsed (header-only read, see message_header.py)
     Local attributes: 
         - uid, id, type, date, time, status, sender, receiver, context and classification
         - dict: dictionary containing all previous information
     Exception if some metadata are missing. They are set has mandatory in XSD message envelope.
     '''
-    def __init__(self, path):
-        with open(path, 'r') as fd:
-            tree = etree.parse(fd)
-            self.__root = tree.getroot()
-            self.__path = path
-            self.uid = self.__root.attrib['uid']
-            self.id = self.__root.xpath('./msgId/id')[0].text
-            self.type = self.__root.xpath('./msgType/code')[0].text
-            self.date = self.__root.xpath('./msgDate/date')[0].text
-            self.time = self.__root.xpath('./msgDate/time')[0].text
-            self.status = self.__root.xpath('./msgStatus/state')[0].text   
-            self.context = self.__root.xpath('./msgContext/context/projRef/projId/id')[0].text
-            self.classification = self.__root.xpath('./secs/sec/secClassDefRef/secClass/name')[0].text
-
-            _msgPty = self.__root.xpath('./msgPty')
-            parties = {}
-            for elt in _msgPty:
-                type = (elt.xpath('./ptyType/code'))[0].text
-                id = (elt.xpath('./party/persRef/persId/id'))[0].text
-                parties[type]=id  
-            self.sender = parties['S']
-            self.receiver = parties['R']
-            
-            self.dict ={'uid':self.uid,
-                        'id':self.id,
-                        'type':self.type,
-                        'date':self.date,
-                        'time':self.time,
-                        'status':self.status,
-                        'context':self.context,
-                        'classif':self.classification,
-                        'sender':self.sender,
-                        'receiver':self.receiver,}
+    def __init__(self, path, fast=True):
+        self.__path = path
+        self.dict = read_header(path, fast)
+        self.uid = self.dict['uid']
+        self.id = self.dict['id']
+        self.type = self.dict['type']
+        self.date = self.dict['date']
+        self.time = self.dict['time']
+        self.status = self.dict['status']
+        self.context = self.dict['context']
+        self.classification = self.dict['classif']
+        self.sender = self.dict['sender']
+        self.receiver = self.dict['receiver']
             
     def __str__(self):
         '''Display message metadata'''
@@ -130,6 +118,15 @@ head = Header(latest_file)
 head.dict
 
 
+# In[ ]:
+
+
+# Message content: one row per mPointVal (serial, mpoint, timestamp, value, unit, vdtm)
+from message_content import read_content
+content = read_content(latest_file, dataframe=True)
+content.groupby('mpoint', observed=True)['value'].describe()
+
+
 # In[4]:
 
 
@@ -143,16 +140,10 @@ print(time)
 # In[5]:
 
 
-# Define pos_hash function which return a positive hash number
-# For removing random seed which is set at each Python runtime, set-up PYTHONHASHSEED value 
-# %env PYTHONHASHSEED=19531130
+# pos_hash returns a positive hash number: keyed BLAKE2 digest, same at each Python runtime
+# (see hums_message.pos_hash, key set by environment variable S5000F_UID_KEY)
 
-import sys
-def pos_hash(s):
-    h=hash(s)
-    if h < 0:
-        h += sys.maxsize
-    return(str(h))
+from hums_message import pos_hash
 
 
 # In[54]:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Batch extraction of S5000F message headers.
+
+Every message file (plain or compressed, see message_io.py) of a folder tree
+is read in a process pool with the header-only read mode of message_header.py,
+so that the time spent per file does not depend on the size of its content.
+One row per file is written to a CSV or Parquet file (chosen from the output
+name). A file that cannot be read is reported with its error and does not
+abort the batch.
+
+Usage:
+    python batch_headers.py <folder or glob> [...] -o headers.csv [-j workers]
+'''
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from message_header import read_header
+from message_io import list_message_files
+
+# output columns: header columns (see message_header.header_fields), then file columns
+COLUMNS = ['file', 'uid', 'id', 'type', 'date', 'time', 'status', 'sender', 'receiver',
+           'context', 'classification', 'size', 'modified', 'error', 'seconds']
+
+# files sent at once to a worker process
+CHUNK = 64
+
+
+def header_row(path, fast=True):
+    '''
+    Header and trailer information of one message file (run in a worker process)
+    Output: row (dictionary, see COLUMNS), the exception in column error if the file
+            cannot be read
+    '''
+    row = dict.fromkeys(COLUMNS)
+    row['file'] = path
+    start = time.perf_counter()
+    try:
+        stat = os.stat(path)
+        row['size'] = stat.st_size
+        row['modified'] = pd.Timestamp(stat.st_mtime_ns, tz='UTC').isoformat()
+        header = read_header(path, fast)
+        header['classification'] = header.pop('classif')
+        row.update(header)
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    row['seconds'] = round(time.perf_counter() - start, 6)
+    return row
+
+
+def extract_headers(inputs, output=None, workers=None, fast=True, chunk=CHUNK):
+    '''
+    Read the headers of message files in parallel
+    Inputs:
+        ** inputs: list of folders or glob patterns of message files
+        ** output: CSV file, or Parquet file if its name ends with '.parquet', None for no file
+        ** workers: number of worker processes (default: number of cores)
+        ** fast: if False, whole messages are parsed (see message_header.read_header)
+        ** chunk: number of files sent at once to a worker
+    Output: pandas DataFrame (one row per file, see COLUMNS), sorted by file name
+    '''
+    files = list_message_files(inputs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(header_row, files, [fast] * len(files), chunksize=chunk))
+    headers = pd.DataFrame(rows, columns=COLUMNS)
+    if output is not None:
+        if str(output).lower().endswith('.parquet'):
+            headers.to_parquet(output, index=False)
+        else:
+            headers.to_csv(output, index=False)
+    return headers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract S5000F message headers in parallel")
+    parser.add_argument('inputs', nargs='+', help="folders or glob patterns of message files")
+    parser.add_argument('-o', '--output', default='headers.csv',
+                        help="CSV file, or Parquet file (*.parquet)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--full', action='store_true', help="parse whole messages")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    headers = extract_headers(args.inputs, args.output, args.workers, fast=not args.full)
+    print(f"{len(headers)} files, {headers['error'].notna().sum()} errors "
+          f"in {round(time.perf_counter() - start, 4)} s")
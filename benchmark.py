@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Benchmark of the GPX -> HUMS message -> analytics pipeline.
+
+Each stage is run on activity_4588550232.xml and on synthetic activities
+made of the same ride repeated 10, 100 and 1000 times (shifted in time):
+    ingest      GPX parsing into TrackPoints (gpx_reader.read_trackpoints)
+    hums        creation of UC50902 message tree (hums_message.build_message)
+    serialize   storage of message in its xml file (hums_message.write_message)
+    stream      incremental creation and storage of message (hums_message.stream_message)
+    fast        storage of message with byte templates (hums_message.fast_message)
+    distance    length of trek (trackpoints.trek_distance)
+    simplify    GPS track simplification, 5 m tolerance (reporting.simplify)
+    deadband    deadband reporting of heart rate (2 bpm) and elevation (0.5 m) (reporting.deadband)
+    export      Parquet export of trek points (trek_export.to_parquet)
+Each stage runs in its own child process, so that its memory is measured
+alone: for each stage and scale, wall time (best of --repeat runs), throughput
+(trek points per second) and peak resident memory of the process (ru_maxrss,
+which unlike tracemalloc includes the memory of libxml2 trees) are reported
+and stored as JSON, with the resident memory once the stage inputs are loaded.
+hums and serialize hold the whole message tree in memory (about 2 kB per trek
+point): they are skipped above --max-tree-points trek points.
+A previous JSON result can be given as baseline to show time ratios.
+
+Usage:
+    python benchmark.py [-s 1 10 100 1000] [-r 3] [-o result.json] [-b baseline.json]
+
+Unix only (resource module).
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gpx_reader
+import hums_message
+import reporting
+import trek_export
+from trackpoints import TrackPoints, trek_distance
+
+ACTIVITY = 'activity_4588550232.xml'
+SCALES = (1, 10, 100, 1000)
+
+STAGES = ('ingest', 'hums', 'serialize', 'stream', 'fast', 'distance', 'simplify', 'deadband',
+          'export')
+# stages building the whole message tree in memory, skipped above MAX_TREE_POINTS trek points
+TREE_STAGES = ('hums', 'serialize')
+MAX_TREE_POINTS = 300000
+# deadband stage: tolerances > 0, reporting is sequential over changes (reporting.deadband_mask)
+DEADBAND = {'heart_rate': (2, '60s'), 'elevation': (0.5, None)}
+
+HEADER = {'msg_date': '2020-04-16', 'msg_time': '16:13:37.0Z', 'msg_type': 'UC50902',
+          'msg_id': 'Bicycle trek chemin de la Simone Aix-en-Provence on 2020-02-25',
+          'msg_status': 'F'}
+TRAILER = {'msg_project': 'ASD/AIA S5000F Bicycle Example',
+           'msg_sender': 'Guillaume OLLIVIER (g.ollivier@a2l.net)',
+           'msg_receiver': 'Bernard RAUST (bernard.raust@edxea.com)',
+           'msg_remarks': 'Feedback about bicycle trek done on 2020-02-25',
+           'msg_classif': 'NUC'}
+
+
+def synthetic_trek(trek, scale):
+    '''Trek made of scale copies of trek, each copy starting one second after the previous one'''
+    if scale == 1:
+        return trek
+    duration = int(trek.timestamp[-1] - trek.timestamp[0]) + 10 ** 9
+    shift = np.repeat(np.arange(scale, dtype=np.int64) * duration, len(trek))
+    columns = {name: np.tile(getattr(trek, name), scale) for name in trek.columns}
+    columns['timestamp'] = columns['timestamp'] + shift
+    return TrackPoints(**columns)
+
+
+def write_gpx(trek, path, chunk_size=100000):
+    '''Write trek points into a Garmin like GPX file (used to create synthetic activities)'''
+    with open(path, 'w') as fd:
+        fd.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 f'<gpx xmlns="{gpx_reader.ns["a"]}" xmlns:ns3="{gpx_reader.ns["ns3"]}">'
+                 '<trk><trkseg>\n')
+        for start in range(0, len(trek), chunk_size):
+            chunk = trek[start:start + chunk_size]
+            times = np.datetime_as_string(chunk.datetime, unit='ms')
+            fd.writelines(
+                f'<trkpt lat="{lat!r}" lon="{lon!r}"><ele>{ele}</ele><time>{t}Z</time>'
+                f'<extensions><ns3:TrackPointExtension><ns3:hr>{hr}</ns3:hr><ns3:cad>{cad}</ns3:cad>'
+                '</ns3:TrackPointExtension></extensions></trkpt>\n'
+                for lat, lon, ele, t, hr, cad in zip(chunk.latitude.tolist(), chunk.longitude.tolist(),
+                                                     chunk.elevation.astype(str), times,
+                                                     chunk.heart_rate.tolist(), chunk.cadence.tolist()))
+        fd.write('</trkseg></trk></gpx>\n')
+
+
+def stage_function(stage, path, trek_file, tmp):
+    '''
+    Function running stage once, its inputs being loaded first
+    Inputs:
+        ** stage: name of stage (see STAGES)
+        ** path: GPX activity file
+        ** trek_file: trek points of the activity (.npz file, see run)
+        ** tmp: folder of output files
+    '''
+    if stage == 'ingest':
+        return lambda: gpx_reader.read_trackpoints(path)
+    with np.load(trek_file) as data:
+        trek = TrackPoints(**{name: data[name] for name in data.files})
+    message_file = os.path.join(tmp, 'message.xml')
+    if stage == 'serialize':
+        message = hums_message.build_message(trek, HEADER, TRAILER)
+        return lambda: hums_message.write_message(message, message_file)
+    return {'hums': lambda: hums_message.build_message(trek, HEADER, TRAILER),
+            'stream': lambda: hums_message.stream_message(trek, message_file, HEADER, TRAILER),
+            'fast': lambda: hums_message.fast_message(trek, message_file, HEADER, TRAILER),
+            'distance': lambda: trek_distance(trek),
+            'simplify': lambda: reporting.simplify(trek, 5.0),
+            'deadband': lambda: reporting.deadband(trek, DEADBAND),
+            'export': lambda: trek_export.to_parquet(trek, os.path.join(tmp, 'trek.parquet'))}[stage]
+
+
+def max_rss():
+    '''Peak resident memory of the current process in MB (ru_maxrss)'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10    # bytes on macOS, kB on Linux
+
+
+def measure(stage, repeat, path, trek_file, tmp):
+    '''
+    Run stage repeat times (in a child process, see run), inputs as in stage_function
+    Output: (best wall time in s, peak resident memory in MB, resident memory in MB
+             once the inputs are loaded)
+    '''
+    function = stage_function(stage, path, trek_file, tmp)
+    base = max_rss()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+        del result
+    return best, max_rss(), base
+
+
+def run(activity=ACTIVITY, scales=SCALES, repeat=3, workdir=None, max_tree_points=MAX_TREE_POINTS):
+    '''
+    Benchmark every stage for each scale, each stage in a new child process
+    Output: list of results {stage, scale, points, seconds, points_per_s, peak_mb, base_mb},
+            None values for the stages skipped (see TREE_STAGES)
+    '''
+    reference = gpx_reader.read_trackpoints(activity)
+    results = []
+    # spawned children do not inherit the memory of this process
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        trek_file = os.path.join(tmp, 'trek.npz')
+        for scale in scales:
+            trek = synthetic_trek(reference, scale)
+            path = activity
+            if scale != 1:
+                path = os.path.join(tmp, f'synthetic_{scale}.gpx')
+                write_gpx(trek, path)
+            np.savez(trek_file, **{name: getattr(trek, name) for name in trek.columns})
+            points = len(trek)
+            del trek
+
+            for stage in STAGES:
+                result = {'stage': stage, 'scale': scale, 'points': points, 'seconds': None,
+                          'points_per_s': None, 'peak_mb': None, 'base_mb': None}
+                results.append(result)
+                if stage in TREE_STAGES and points > max_tree_points:
+                    print(f"{stage:10} x{scale:<5} {points:>9} points skipped (message tree too large)")
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    seconds, peak, base = pool.submit(measure, stage, repeat, path, trek_file,
+                                                      tmp).result()
+                result.update(seconds=round(seconds, 6),
+                              points_per_s=round(points / seconds) if seconds else None,
+                              peak_mb=round(peak, 3), base_mb=round(base, 3))
+                print(f"{stage:10} x{scale:<5} {points:>9} points "
+                      f"{seconds:10.4f} s {points / seconds:14,.0f} points/s "
+                      f"{peak:10.1f} MB ({base:.1f} MB before)")
+            if path != activity:
+                os.remove(path)
+    return results
+
+
+def compare(results, baseline):
+    '''Print time ratio of each stage compared with baseline results (> 1 is slower)'''
+    reference = {(r['stage'], r['scale']): r for r in baseline['results']}
+    print(f"\n{'stage':10} {'scale':>6} {'seconds':>10} {'baseline':>10} {'ratio':>7}")
+    for r in results:
+        b = reference.get((r['stage'], r['scale']))
+        if b is None or r['seconds'] is None or b['seconds'] is None:
+            continue
+        ratio = r['seconds'] / b['seconds'] if b['seconds'] else float('nan')
+        flag = '  <-- slower' if ratio > 1.2 else ''
+        print(f"{r['stage']:10} {r['scale']:>6} {r['seconds']:10.4f} {b['seconds']:10.4f} "
+              f"{ratio:7.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the GPX to HUMS pipeline")
+    parser.add_argument('-a', '--activity', default=ACTIVITY, help="GPX activity file")
+    parser.add_argument('-s', '--scales', type=int, nargs='+', default=list(SCALES),
+                        help="synthetic activity sizes, as multiples of the activity")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="runs per stage (best time kept)")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="JSON result file")
+    parser.add_argument('-b', '--baseline', help="JSON result file to compare with")
+    parser.add_argument('-m', '--max-tree-points', type=int, default=MAX_TREE_POINTS,
+                        help="trek points above which message tree stages are skipped")
+    args = parser.parse_args()
+
+    results = run(args.activity, args.scales, args.repeat, max_tree_points=args.max_tree_points)
+    with open(args.output, 'w') as fd:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'activity': args.activity,
+                   'results': results}, fd, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            compare(results, json.load(fd))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Bulk ingestion of a folder of Garmin GPX (or FIT) activities.
+
+Activity files are parsed in parallel in a process pool. Trek points of each
+activity are written into a columnar dataset (Parquet) partitioned by
+activity id and date:
+
+    <output>/activity_id=<id>/date=<YYYY-MM-DD>/part-0.parquet
+
+Activity ids are unique in a batch: files which would share one (e.g. x.gpx
+and x.fit) get their extension appended to it (see activity_ids).
+
+A manifest (manifest.json) summarizes every processed file. A file that
+cannot be parsed is reported in the manifest and does not abort the batch.
+A file without any trek point (e.g. a S5000F message among *.xml files) is
+reported as skipped.
+
+Usage:
+    python bulk_ingest.py <folder or glob> [...] -o <output folder> [-j workers]
+'''
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import trek_cache
+import trek_export
+from file_utils import list_files
+
+ACTIVITY_PATTERNS = ('*.gpx', '*.xml', '*.fit')
+
+
+def list_activity_files(inputs):
+    '''
+    Expand input folders and glob patterns into a sorted list of activity files
+    Folders are searched recursively for *.gpx, *.xml and *.fit files.
+    '''
+    return list_files(inputs, ACTIVITY_PATTERNS)
+
+
+def activity_id(path):
+    '''Garmin activity id from file name 'activity_<id>.xml', else file name itself'''
+    name = os.path.splitext(os.path.basename(path))[0]
+    match = re.search(r'activity_(\d+)', name)
+    return match.group(1) if match else name
+
+
+def activity_ids(files):
+    '''
+    Unique activity id of each file of a batch (see activity_id)
+    Files sharing an id get their extension appended to it ('x_gpx', 'x_fit'), then a
+    counter if they are still not unique (same file name in several folders).
+    Output: dictionary {path: activity id}
+    '''
+    ids = {path: activity_id(path) for path in files}
+    counts = Counter(ids.values())
+    used = set()
+    for path in sorted(files):
+        id_ = ids[path]
+        if counts[id_] > 1:
+            id_ = f"{id_}_{os.path.splitext(path)[1].lstrip('.').lower()}"
+            candidate, n = id_, 1
+            while candidate in used:
+                n += 1
+                candidate = f"{id_}_{n}"
+            id_ = candidate
+        ids[path] = id_
+        used.add(id_)
+    return ids
+
+
+def ingest_file(path, output, activity=None):
+    '''
+    Parse one activity file and write its trek points into the partitioned dataset
+    Inputs:
+        ** path: pathname of GPX or FIT file
+        ** output: root folder of the dataset
+        ** activity: activity id (default: activity_id(path))
+    Output: manifest entry (dictionary), status 'ERROR' with the exception message
+            if the file cannot be parsed or written
+    '''
+    entry = {'file': path, 'activity_id': activity or activity_id(path), 'status': 'OK',
+             'points': 0, 'partitions': [], 'error': None}
+    start = time.perf_counter()
+    try:
+        trek = trek_cache.read_activity(path)
+        entry['points'] = len(trek)
+        if not len(trek):
+            entry['status'] = 'SKIPPED'
+            entry['error'] = "no trek point (not a GPX or FIT activity)"
+        else:
+            entry['start'] = str(trek.datetime[0])
+            entry['end'] = str(trek.datetime[-1])
+        days = trek.datetime.astype('datetime64[D]')
+        for day in np.unique(days):
+            part = trek[days == day]
+            folder = os.path.join(output, f"activity_id={entry['activity_id']}", f"date={day}")
+            os.makedirs(folder, exist_ok=True)
+            filename = os.path.join(folder, 'part-0.parquet')
+            trek_export.to_parquet(part, filename)
+            entry['partitions'].append(filename)
+    except Exception as e:
+        entry['status'] = 'ERROR'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def ingest(inputs, output, workers=None):
+    '''
+    Parse activity files in parallel and write the partitioned dataset and its manifest
+    Inputs:
+        ** inputs: list of folders or glob patterns of GPX or FIT files
+        ** output: root folder of the dataset
+        ** workers: number of worker processes (default: number of cores)
+    Output: manifest (dictionary), also stored in <output>/manifest.json
+    '''
+    files = list_activity_files(inputs)
+    ids = activity_ids(files)
+    os.makedirs(output, exist_ok=True)
+    start = time.perf_counter()
+    entries = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_file, path, output, ids[path]): path for path in files}
+        for future in as_completed(futures):
+            try:
+                entries.append(future.result())
+            except Exception as e:          # worker process died
+                entries.append({'file': futures[future], 'activity_id': ids[futures[future]],
+                                'status': 'ERROR', 'points': 0, 'partitions': [],
+                                'error': f"{type(e).__name__}: {e}"})
+    entries.sort(key=lambda entry: entry['file'])
+    manifest = {'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+                'files': len(entries),
+                'errors': sum(entry['status'] == 'ERROR' for entry in entries),
+                'skipped': sum(entry['status'] == 'SKIPPED' for entry in entries),
+                'points': sum(entry['points'] for entry in entries),
+                'seconds': round(time.perf_counter() - start, 4),
+                'activities': entries}
+    with open(os.path.join(output, 'manifest.json'), 'w') as fd:
+        json.dump(manifest, fd, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse Garmin GPX or FIT activities in parallel")
+    parser.add_argument('inputs', nargs='+', help="folders or glob patterns of activity files")
+    parser.add_argument('-o', '--output', default='trek_dataset', help="dataset root folder")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    manifest = ingest(args.inputs, args.output, args.workers)
+    print(f"{manifest['files']} files, {manifest['points']} trek points, "
+          f"{manifest['errors']} errors, {manifest['skipped']} skipped in {manifest['seconds']} s")
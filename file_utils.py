@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Helpers on input files shared by the batch tools.
+
+list_files() expands the folders and glob patterns given on the command line
+of bulk_ingest.py, batch_headers.py and message_catalog.py; file_hash() is the
+content hash used by the activity cache (trek_cache.py) and the message
+catalog (message_catalog.py).
+'''
+
+import glob
+import hashlib
+import os
+
+
+def list_files(inputs, patterns):
+    '''
+    Expand input folders and glob patterns into a sorted list of files
+    Inputs:
+        ** inputs: folder, glob pattern or list of them
+        ** patterns: file name patterns searched recursively in folders, e.g. ('*.gpx', '*.fit')
+    Output: sorted list of pathnames
+    '''
+    if isinstance(inputs, (str, os.PathLike)):
+        inputs = [inputs]
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in patterns:
+                files.update(glob.glob(os.path.join(item, '**', pattern), recursive=True))
+        else:
+            files.update(glob.glob(str(item), recursive=True))
+    return sorted(files)
+
+
+def file_hash(path, block_size=1 << 20):
+    '''BLAKE2b hex digest of file content'''
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Reader of Garmin FIT activity files.
+
+Record messages (global message number 20) are decoded straight into the
+typed columns of TrackPoints (see trackpoints.py), so that a FIT activity
+feeds the same trek pipeline as a GPX file without conversion.
+
+A single pass over the file locates every data message with its
+definition; all records sharing a definition are then decoded at once with
+numpy.frombuffer and a structured dtype built from the definition message.
+
+write_fit() encodes TrackPoints into a minimal FIT activity file and is
+used to generate local test files.
+'''
+
+import struct
+
+import numpy as np
+
+from trackpoints import TrackPoints, SCHEMA, MISSING_INT
+import gpx_reader
+
+# version of decoding rules, to be changed when extracted values change (see trek_cache.py)
+PARSER_VERSION = '1'
+
+FIT_EPOCH = 631065600               # 1989-12-31T00:00:00Z in unix seconds
+RECORD = 20                         # global message number of record messages
+FILE_ID = 0                         # global message number of file_id messages
+SEMICIRCLE = 180.0 / 2 ** 31        # degrees per semicircle
+
+# FIT base type number: (numpy type code, invalid value)
+BASE_TYPES = {0x00: ('u1', 0xFF),   # enum
+              0x01: ('i1', 0x7F),
+              0x02: ('u1', 0xFF),
+              0x03: ('i2', 0x7FFF),
+              0x04: ('u2', 0xFFFF),
+              0x05: ('i4', 0x7FFFFFFF),
+              0x06: ('u4', 0xFFFFFFFF),
+              0x07: ('u1', 0x00),   # string
+              0x08: ('f4', None),
+              0x09: ('f8', None),
+              0x0A: ('u1', 0x00),   # uint8z
+              0x0B: ('u2', 0x0000),
+              0x0C: ('u4', 0x00000000),
+              0x0D: ('u1', 0xFF),   # byte
+              0x0E: ('i8', 0x7FFFFFFFFFFFFFFF),
+              0x0F: ('u8', 0xFFFFFFFFFFFFFFFF),
+              0x10: ('u8', 0x0000000000000000)}
+
+# record message fields: field number: (name, scale, offset)
+RECORD_FIELDS = {253: ('timestamp', 1, 0),
+                 0:   ('position_lat', 1, 0),
+                 1:   ('position_long', 1, 0),
+                 2:   ('altitude', 5, 500),
+                 3:   ('heart_rate', 1, 0),
+                 4:   ('cadence', 1, 0),
+                 6:   ('speed', 1000, 0),
+                 7:   ('power', 1, 0),
+                 13:  ('temperature', 1, 0),
+                 73:  ('enhanced_speed', 1000, 0),
+                 78:  ('enhanced_altitude', 5, 500)}
+
+_CRC_TABLE = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+              0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
+
+
+def fit_crc(data, crc=0):
+    '''FIT CRC-16 of bytes data'''
+    for byte in data:
+        tmp = _CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _CRC_TABLE[byte & 0xF]
+        tmp = _CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+class FitError(ValueError):
+    '''FIT file is not valid'''
+
+
+class Definition():
+    '''
+    Definition message of a FIT file
+    Local attributes:
+        - global_num: global message number
+        - size: size in bytes of data messages (without record header)
+        - dtype: numpy structured dtype of data messages
+        - fields: {field number: (base type number, count)}
+    '''
+    def __init__(self, buf, pos, developer):
+        big_endian = buf[pos + 1] == 1
+        endian = '>' if big_endian else '<'
+        self.global_num, = struct.unpack_from(endian + 'H', buf, pos + 2)
+        n = buf[pos + 4]
+        names, formats, offsets, self.fields = [], [], [], {}
+        size = 0
+        for i in range(n):
+            num, field_size, base_type = buf[pos + 5 + 3 * i: pos + 8 + 3 * i]
+            code, _ = BASE_TYPES.get(base_type & 0x1F, ('u1', None))
+            item = np.dtype(code).itemsize
+            count = field_size // item
+            if field_size % item or count == 0:       # malformed field: keep bytes
+                code, item, count = 'u1', 1, field_size
+            names.append(f'f{num}')
+            formats.append((endian + code, (count,)) if count > 1 else endian + code)
+            offsets.append(size)
+            self.fields[num] = (base_type & 0x1F, count)
+            size += field_size
+        self.length = 5 + 3 * n                       # length of definition content
+        if developer:
+            n_dev = buf[pos + self.length]
+            # developer field definition: field number, size, developer data index
+            size += sum(buf[pos + self.length + 2 + 3 * i] for i in range(n_dev))
+            self.length += 1 + 3 * n_dev
+        self.size = size
+        self.dtype = np.dtype({'names': names, 'formats': formats,
+                               'offsets': offsets, 'itemsize': max(size, 1)})
+
+
+def _scan(buf, start, end):
+    '''
+    Locate data messages of a FIT file
+    Output: list of (definition, array of data message offsets) and the list of
+            (position in file, definition, time offset) of compressed timestamp records
+    '''
+    local = {}                      # local message type: Definition
+    groups = {}                     # id(Definition): (Definition, list of offsets)
+    compressed = []
+    pos = start
+    while pos < end:
+        header = buf[pos]
+        if header & 0x80:           # compressed timestamp header
+            try:
+                definition = local[(header >> 5) & 0x03]
+            except KeyError:
+                raise FitError(f"compressed timestamp message at byte {pos} has no definition")
+            compressed.append((pos + 1, definition, header & 0x1F))
+        elif header & 0x40:         # definition message
+            definition = Definition(buf, pos + 1, header & 0x20)
+            local[header & 0x0F] = definition
+            groups[id(definition)] = (definition, [])
+            pos += 1 + definition.length
+            continue
+        else:
+            try:
+                definition = local[header & 0x0F]
+            except KeyError:
+                raise FitError(f"data message at byte {pos} has no definition")
+        groups[id(definition)][1].append(pos + 1)
+        pos += 1 + definition.size
+    return [(d, np.array(o, dtype=np.int64)) for d, o in groups.values() if o], compressed
+
+
+def _decode(raw, definition, offsets):
+    '''Decode data messages located at offsets into a structured array'''
+    block = raw[offsets[:, None] + np.arange(definition.size)]
+    return np.ascontiguousarray(block).view(definition.dtype)[:, 0]
+
+
+def _field(records, definition, num):
+    '''Field num of records as float64 (NaN if field missing or invalid)'''
+    if num not in definition.fields or definition.fields[num][1] != 1:
+        return np.full(len(records), np.nan)
+    base_type, _ = definition.fields[num]
+    values = records[f'f{num}']
+    result = values.astype(np.float64)
+    invalid = BASE_TYPES.get(base_type, (None, None))[1]
+    if invalid is not None:
+        result[values == invalid] = np.nan
+    _, scale, offset = RECORD_FIELDS[num]
+    return result / scale - offset
+
+
+def _compressed_timestamps(raw, compressed, definitions):
+    '''
+    Timestamps of records having a compressed timestamp header
+    Messages of the file are walked in order to get the last full timestamp.
+    '''
+    events = []                             # (position, timestamp or None, time offset)
+    for definition, offsets in definitions:
+        if 253 in definition.fields:
+            values = _decode(raw, definition, offsets)['f253'].astype(np.int64)
+            events.extend(zip(offsets.tolist(), values.tolist(), [None] * len(offsets)))
+    events.extend((pos, None, offset) for pos, _, offset in compressed)
+    events.sort(key=lambda event: event[0])
+    result, last = {}, 0
+    for pos, timestamp, offset in events:
+        if offset is None:
+            last = timestamp
+        else:
+            timestamp = (last & ~0x1F) + offset
+            if offset < (last & 0x1F):
+                timestamp += 0x20
+            result[pos] = last = timestamp
+    return result
+
+
+def read_fit(path, fields=gpx_reader.DEFAULT_FIELDS, check_crc=False):
+    '''
+    Read record messages of a FIT activity file into typed columns
+    Inputs:
+        ** path: pathname of FIT file
+        ** fields: columns to extract (see gpx_reader.FIELDS)
+        ** check_crc: if True, verify file CRC
+    Output: TrackPoints ordered by time, with its time index
+    '''
+    with open(path, 'rb') as fd:
+        buf = fd.read()
+    if len(buf) < 12 or buf[8:12] != b'.FIT':
+        raise FitError(f"{path} is not a FIT file")
+    header_size = buf[0]
+    data_size, = struct.unpack_from('<I', buf, 4)
+    end = min(header_size + data_size, len(buf))
+    if check_crc and fit_crc(buf[:end + 2]) != 0:
+        raise FitError(f"{path}: CRC error")
+
+    definitions, compressed = _scan(buf, header_size, end)
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    timestamps = _compressed_timestamps(raw, compressed, definitions) if compressed else {}
+
+    columns = {name: [] for name in ['position'] + list(RECORD_FIELDS)}
+    for definition, offsets in definitions:
+        if definition.global_num != RECORD:
+            continue
+        records = _decode(raw, definition, offsets)
+        columns['position'].append(offsets)
+        for num in RECORD_FIELDS:
+            values = _field(records, definition, num)
+            if num == 253 and timestamps:
+                for i, pos in enumerate(offsets.tolist()):
+                    if pos in timestamps:
+                        values[i] = timestamps[pos]
+            columns[num].append(values)
+    if not columns['position']:
+        return TrackPoints.empty(0, ['timestamp'] + [f for f in fields if f != 'timestamp'])
+    columns = {name: np.concatenate(values) for name, values in columns.items()}
+    order = np.argsort(columns['position'], kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+
+    def prefer(enhanced, basic):
+        return np.where(np.isnan(columns[enhanced]), columns[basic], columns[enhanced])
+
+    valid = ~np.isnan(columns[253])
+    values = {'timestamp': (columns[253] + FIT_EPOCH) * 1e9,
+              'latitude': columns[0] * SEMICIRCLE,
+              'longitude': columns[1] * SEMICIRCLE,
+              'elevation': prefer(78, 2),
+              'heart_rate': columns[3],
+              'cadence': columns[4],
+              'power': columns[7],
+              'atemp': columns[13],
+              'speed': prefer(73, 6)}
+    trek = {}
+    for name in ['timestamp'] + [f for f in fields if f != 'timestamp']:
+        column = values[name][valid]
+        if np.issubdtype(SCHEMA[name], np.integer):
+            column = np.where(np.isnan(column), MISSING_INT, column)
+        trek[name] = column.astype(SCHEMA[name])
+    return TrackPoints(**trek).sort()
+
+
+def write_fit(path, trek):
+    '''
+    Write trek points into a FIT activity file (file_id and record messages)
+    Inputs:
+        ** path: pathname of FIT file
+        ** trek: TrackPoints (timestamp, latitude, longitude, elevation, heart_rate, cadence)
+    Used to generate local FIT files for tests and benchmarks.
+    '''
+    n = len(trek)
+    # file_id message: type = activity (4), manufacturer = development (255)
+    file_id = bytes([0x40, 0, 0]) + struct.pack('<H', FILE_ID) + bytes([2, 0, 1, 0x00, 1, 2, 0x84])
+    file_id += bytes([0x00, 4]) + struct.pack('<H', 255)
+    # record message definition, local message type 1
+    record_def = bytes([0x41, 0, 0]) + struct.pack('<H', RECORD) + bytes([6,
+                       253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84, 3, 1, 0x02, 4, 1, 0x02])
+    records = np.zeros(n, dtype=[('header', 'u1'), ('f253', '<u4'), ('f0', '<i4'), ('f1', '<i4'),
+                                 ('f2', '<u2'), ('f3', 'u1'), ('f4', 'u1')])
+    records['header'] = 0x01
+    records['f253'] = trek.timestamp // 10 ** 9 - FIT_EPOCH
+    lat, lon = trek.latitude / SEMICIRCLE, trek.longitude / SEMICIRCLE
+    records['f0'] = np.where(np.isnan(lat), 0x7FFFFFFF, np.round(np.nan_to_num(lat)))
+    records['f1'] = np.where(np.isnan(lon), 0x7FFFFFFF, np.round(np.nan_to_num(lon)))
+    alt = (trek.elevation.astype(np.float64) + 500) * 5
+    records['f2'] = np.where(np.isnan(alt), 0xFFFF, np.round(np.nan_to_num(alt)))
+    records['f3'] = np.where(trek.heart_rate < 0, 0xFF, trek.heart_rate)
+    records['f4'] = np.where(trek.cadence < 0, 0xFF, trek.cadence)
+    data = file_id + record_def + records.tobytes()
+
+    header = bytes([14, 0x20]) + struct.pack('<HI', 2132, len(data)) + b'.FIT'
+    header += struct.pack('<H', fit_crc(header))
+    content = header + data
+    with open(path, 'wb') as fd:
+        fd.write(content + struct.pack('<H', fit_crc(content)))
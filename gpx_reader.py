@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Streaming reader of Garmin GPX activity files.
+
+Trek points located at gpx/trk/trkseg/trkpt are read with etree.iterparse:
+elements already processed are cleared so that memory used by the parser
+does not grow with the length of the activity.
+'''
+
+import io
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+import numpy as np
+
+from trackpoints import TrackPoints
+
+# version of parsing rules, to be changed when extracted values change (see trek_cache.py)
+PARSER_VERSION = '2'
+
+# namespace dictionary of Garmin GPX files
+ns = {'a': 'http://www.topografix.com/GPX/1/1',
+      'ns2': 'http://www.garmin.com/xmlschemas/GpxExtensions/v3',
+      'ns3': 'http://www.garmin.com/xmlschemas/TrackPointExtension/v1'}
+
+TRKPT = '{%s}trkpt' % ns['a']
+
+# Declarative map of trek point fields: column name: (source, required)
+# source is either an attribute of trkpt ('@lat') or the local name of a child element of
+# trkpt or of its extensions (Garmin TrackPointExtension: hr, cad, atemp, speed, power, ...),
+# whatever its namespace and position. Missing optional values are stored as NaN for float
+# columns and as trackpoints.MISSING_INT for integer columns. A missing required value raises
+# a ValueError.
+FIELDS = {'timestamp':  ('time', True),
+          'latitude':   ('@lat', True),
+          'longitude':  ('@lon', True),
+          'elevation':  ('ele', False),
+          'heart_rate': ('hr', False),
+          'cadence':    ('cad', False),
+          'power':      ('power', False),
+          'atemp':      ('atemp', False),
+          'speed':      ('speed', False)}
+
+DEFAULT_FIELDS = ('timestamp', 'latitude', 'longitude', 'elevation', 'heart_rate', 'cadence')
+
+
+class FieldExtractor():
+    '''
+    Field map compiled into lookup tables, once for a whole file
+    Input: list of column names (keys of FIELDS), timestamp is always extracted
+    Local attributes:
+        - attributes: list of (trkpt attribute, column name)
+        - tags: tag dispatch table {element local name: column name}
+        - required: set of column names which must be present in each trkpt
+    '''
+    def __init__(self, fields=DEFAULT_FIELDS):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown trek point fields: {sorted(unknown)}")
+        self.columns = ['timestamp'] + [f for f in fields if f != 'timestamp']
+        self.attributes = [(FIELDS[f][0][1:], f) for f in self.columns
+                           if FIELDS[f][0].startswith('@')]
+        self.tags = {FIELDS[f][0]: f for f in self.columns
+                     if not FIELDS[f][0].startswith('@')}
+        self.required = {f for f in self.columns if FIELDS[f][1]}
+        self._dispatch = {}         # cache {qualified tag: column name or None}
+
+    def column(self, tag):
+        '''Column name fed by element tag ('{namespace}localname'), None if not extracted'''
+        try:
+            return self._dispatch[tag]
+        except KeyError:
+            column = self._dispatch[tag] = self.tags.get(tag[tag.rfind('}') + 1:])
+            return column
+
+    def extract(self, e, buffers, i, times):
+        '''
+        Store values of trek point element e at position i of column buffers
+        Time strings are appended to list times (converted per chunk).
+        '''
+        found = set()
+        for attribute, column in self.attributes:
+            value = e.get(attribute)
+            if value is not None:
+                buffers[column][i] = value
+                found.add(column)
+        for child in e.iter():
+            if child is e or not isinstance(child.tag, str) or child.text is None:
+                continue
+            column = self.column(child.tag)
+            if column == 'timestamp':
+                times.append(child.text)
+            elif column is not None:
+                buffers[column][i] = child.text
+            else:
+                continue
+            found.add(column)
+        missing = self.required - found
+        if missing:
+            raise ValueError(f"trkpt line {e.sourceline}: missing {sorted(missing)}")
+
+
+def _timestamps(values):
+    '''Convert ISO UTC time strings ('2020-02-25T06:27:35.000Z') to epoch nanoseconds'''
+    return np.array([v.rstrip('Z') for v in values], dtype='datetime64[ns]').view(np.int64)
+
+
+def iter_trkpt_chunks(path, chunk_size=10000, fields=DEFAULT_FIELDS, recover=False):
+    '''
+    Stream trek points of a GPX file by chunks
+    Inputs:
+        ** path: pathname (or file object) of GPX file
+        ** chunk_size: maximum number of trek points per chunk
+        ** fields: columns to extract (keys of FIELDS)
+        ** recover: if True, unbalanced tags around trkpt elements are ignored
+    Output: generator of TrackPoints chunks (typed columns, see trackpoints.py)
+    Each trkpt element is cleared once read, together with its already
+    processed siblings, so that peak memory does not depend on file size.
+    Values are written into preallocated typed buffers while parsing.
+    '''
+    extractor = FieldExtractor(fields)
+
+    def new_chunk():
+        chunk = TrackPoints.empty(chunk_size, extractor.columns)
+        return chunk, {name: getattr(chunk, name) for name in chunk.columns}, []
+
+    chunk, buffers, times = new_chunk()
+    i = 0
+    for event, e in etree.iterparse(path, events=('end',), tag=TRKPT, recover=recover):
+        extractor.extract(e, buffers, i, times)
+        i += 1
+
+        # free memory of processed trek points
+        e.clear()
+        while e.getprevious() is not None:
+            del e.getparent()[0]
+
+        if i == chunk_size:
+            chunk.timestamp[:] = _timestamps(times)
+            yield chunk
+            chunk, buffers, times = new_chunk()
+            i = 0
+
+    if i:
+        chunk = chunk.truncate(i)
+        chunk.timestamp[:] = _timestamps(times)
+        yield chunk
+
+
+def read_trackpoints(path, chunk_size=10000, fields=DEFAULT_FIELDS):
+    '''
+    Read a GPX file into typed columns
+    Inputs:
+        ** path: pathname of GPX file
+        ** chunk_size: number of trek points parsed in each chunk
+        ** fields: columns to extract (keys of FIELDS), e.g. DEFAULT_FIELDS + ('power',)
+    Output: TrackPoints ordered by time, with its time index
+    '''
+    return TrackPoints.concat(iter_trkpt_chunks(path, chunk_size, fields)).sort()
+
+
+def read_gpx(path, chunk_size=10000, fields=DEFAULT_FIELDS):
+    '''
+    Read a GPX file into the trek dataframe used to create HUMS messages
+    Inputs:
+        ** path: pathname of GPX file
+        ** chunk_size: number of trek points parsed in each chunk
+        ** fields: columns to extract (keys of FIELDS)
+    Output: pandas dataframe with typed columns Longitude, Latitude, Elevation,
+            HeartRate and Cadence, string columns Date and Time, indexed by
+            the datetime of each trek point
+    '''
+    return read_trackpoints(path, chunk_size, fields).to_dataframe()
+
+
+def split_ranges(path, n_ranges):
+    '''
+    Split trek points of a GPX file into byte ranges aligned on </trkpt> boundaries
+    Inputs:
+        ** path: pathname of GPX file
+        ** n_ranges: number of ranges wanted
+    Output: (root start tag '<gpx ...>' as bytes, list of (start, end) byte ranges
+            in file order, each range holding whole trkpt elements)
+    '''
+    with open(path, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        match = re.search(rb'<(?:\w+:)?gpx[\s>]', mm)
+        first = mm.find(b'<trkpt')
+        last = mm.rfind(b'</trkpt>')
+        if match is None or first < 0 or last < 0:
+            return None, []
+        root_tag = mm[match.start():mm.find(b'>', match.start()) + 1]
+        end = last + len(b'</trkpt>')
+        step = max(1, (end - first) // n_ranges)
+        bounds = [first]
+        while True:
+            i = mm.find(b'</trkpt>', bounds[-1] + step)
+            if i < 0 or i + len(b'</trkpt>') >= end:
+                break
+            bounds.append(i + len(b'</trkpt>'))
+        bounds.append(end)
+    return root_tag, list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_range(path, root_tag, start, end, fields):
+    '''Parse trek points located in byte range [start, end) of a GPX file (worker process)'''
+    with open(path, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        document = root_tag + mm[start:end] + b'</gpx>'
+    chunks = iter_trkpt_chunks(io.BytesIO(document), chunk_size=100000, fields=fields, recover=True)
+    return TrackPoints.concat(chunks)
+
+
+def read_trackpoints_parallel(path, workers=None, fields=DEFAULT_FIELDS, min_range=4 << 20):
+    '''
+    Read a large GPX file with several processes
+    The file is memory-mapped and split into byte ranges aligned on </trkpt>
+    boundaries (see split_ranges); each range is parsed in a worker process and
+    typed column chunks are concatenated in time order.
+    Inputs:
+        ** path: pathname of GPX file
+        ** workers: number of worker processes (default: number of cores)
+        ** fields: columns to extract (keys of FIELDS)
+        ** min_range: minimum size in bytes of a range, smaller files are read serially
+    Output: TrackPoints ordered by time, with its time index
+    '''
+    workers = workers or os.cpu_count() or 1
+    n_ranges = min(workers, max(1, os.path.getsize(path) // min_range))
+    if n_ranges == 1:
+        return read_trackpoints(path, fields=fields)
+    root_tag, ranges = split_ranges(path, n_ranges)
+    if not ranges:
+        return read_trackpoints(path, fields=fields)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        chunks = pool.map(_read_range, *zip(*[(path, root_tag, start, end, fields)
+                                               for start, end in ranges]))
+        return TrackPoints.concat(chunks).sort()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Fleet message: one S5000F message UC50902 reporting many bikes.
+
+A fleet is a mapping {serial number: activity file or list of activity files}.
+The serialPV element of each bike is written by a worker process into its own
+temporary file (hums_message.write_serialPV), so that a worker only holds the
+trek points of one bike. The message is then assembled by streaming header,
+serialPV parts (sorted by serial number) and trailer into the output file,
+compressed if its name ends with '.xml.gz' or '.xml.zst'.
+
+Usage:
+    fleet = {'46': 'activity_4588550232.xml', '47': ['ride_1.gpx', 'ride_2.fit']}
+    report = fleet_message(fleet, 'fleet.xml', header, trailer)
+'''
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import hums_message
+import message_index
+import trek_cache
+from hums_message import CHUNK_SIZE, MPOINTS, SERIAL_PV
+from message_io import open_message
+from trackpoints import TrackPoints
+
+
+def load_bike(activities):
+    '''TrackPoints of one bike from one or several activity files, sorted by time'''
+    if isinstance(activities, (str, os.PathLike)):
+        activities = [activities]
+    return TrackPoints.concat([trek_cache.load_trackpoints(path) for path in activities]).sort()
+
+
+def write_bike(serial, activities, path, prod_id, prod_var_id, mpoints=MPOINTS,
+               chunk_size=CHUNK_SIZE, transform=None):
+    '''
+    Write element serialPV of one bike into file path (run in a worker process)
+    Inputs:
+        ** serial: serial number of bike (serialPV/serPVId/id)
+        ** activities: activity file or list of activity files of bike
+        ** transform: function applied to the TrackPoints of bike before writing
+                      (e.g. reporting.deadband), None for no transformation
+    Output: fleet report entry (dictionary), status 'ERROR' if the activities of the bike
+            cannot be read or written
+    '''
+    entry = {'serial': serial, 'activities': activities, 'file': path, 'status': 'OK',
+             'points': 0, 'bytes': 0, 'error': None, 'index': []}
+    start = time.perf_counter()
+    try:
+        trek = load_bike(activities)
+        if transform is not None:
+            trek = transform(trek)
+        entry['points'] = len(trek)
+        with open(path, 'wb') as fd:
+            hums_message.write_serialPV(fd, trek, prod_id, prod_var_id, serial, mpoints, chunk_size,
+                                        index=entry['index'])
+        entry['bytes'] = os.path.getsize(path)
+    except Exception as e:
+        entry['status'] = 'ERROR'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def fleet_message(fleet, path, header, trailer, prod_id=SERIAL_PV['prod_id'],
+                  prod_var_id=SERIAL_PV['prod_var_id'], mpoints=MPOINTS, chunk_size=CHUNK_SIZE,
+                  transform=None, workers=None, index=False):
+    '''
+    Write one message UC50902 with a serialPV element for each bike of fleet
+    Inputs:
+        ** fleet: dictionary {serial number: activity file or list of activity files}
+        ** path: pathname of message file
+        ** header, trailer: see hums_message.build_message
+        ** prod_id, prod_var_id: product and product variant of fleet bikes
+        ** mpoints, chunk_size: see hums_message.fast_message
+        ** transform: function applied to trek points of each bike (see write_bike)
+        ** workers: number of worker processes (default: number of cores)
+        ** index: if True, write the offset index of the message (see message_index.py)
+    Output: report (dictionary): message uid, bikes entries and number of errors.
+            Bikes in error are not written in the message.
+    Raise ValueError if index is True and the message is compressed.
+    '''
+    if index:
+        message_index.check_uncompressed(path)
+    start = time.perf_counter()
+    msg_uid, prefix, suffix = hums_message.message_shell(header, trailer)
+    folder = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=folder) as tmp:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(write_bike, serial, activities,
+                                   os.path.join(tmp, f'serialPV-{i}.xml'), prod_id, prod_var_id,
+                                   mpoints, chunk_size, transform)
+                       for i, (serial, activities) in enumerate(sorted(fleet.items()))]
+            bikes = [future.result() for future in futures]
+
+        offsets = []
+        with open_message(path, 'wb') as fd:
+            fd.write(prefix)
+            position = len(prefix)
+            for entry in bikes:
+                if entry['status'] == 'OK':
+                    offsets += [message_index.shift_entry(mpoint, position)
+                                for mpoint in entry['index']]
+                    with open(entry['file'], 'rb') as part:
+                        shutil.copyfileobj(part, fd, 1 << 20)
+                    position += entry['bytes']
+            fd.write(suffix)
+    if index:
+        message_index.save_index(path, msg_uid, offsets)
+    for entry in bikes:
+        del entry['file'], entry['index']
+    return {'uid': msg_uid, 'file': path,
+            'bikes': bikes,
+            'points': sum(entry['points'] for entry in bikes),
+            'errors': sum(entry['status'] != 'OK' for entry in bikes),
+            'seconds': round(time.perf_counter() - start, 4)}
@@ -0,0 +1,564 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Creation of S5000F message UC50902 'Report Usage Information' from trek points.
+
+Functions follow the parts of a S5000F message (see 'Create Hums message.py'):
+    2-0 XML schema reference           new_message()
+    2-1 message header                 Message_Header(), add_header()
+    2-2 message content                add_serialPV(), mPoint()
+    2-3 message trailer                Message_Trailer(), add_trailer()
+build_message() chains these steps for a whole trek and write_message()
+stores the message in its xml file.
+
+stream_message() writes the same bytes incrementally with etree.xmlfile:
+header, each mPointVal and trailer go straight to the output file, so that
+memory used does not depend on the length of the trek.
+
+fast_message() writes the same bytes again without lxml: the content is
+filled into precompiled byte templates (text escaped as lxml does) and
+accumulated in a reusable bytearray flushed to a buffered file. With
+verify=True its output is compared with the lxml path.
+
+Values are written as the shortest text which reads back as the same number
+of the TrackPoints column type (see value_strings), not as the text of the
+GPX file: latitude 43.60018135048449039459228515625 (the exact decimal form
+of a float64) is written 43.60018135048449. Messages are byte-identical
+between the three paths, not to messages created from the GPX text.
+
+Missing measurement values (NaN, trackpoints.MISSING_INT) are not reported:
+no mPointVal is written for them, by any of the three paths. Values hidden
+from a trek or not kept by reporting.deadband are removed from messages
+this way.
+
+Message files named '*.xml.gz' or '*.xml.zst' are compressed while they are
+written (see message_io.py).
+'''
+
+import hashlib
+import os
+import sys
+from xml.sax.saxutils import escape
+
+import numpy as np
+from lxml import etree
+
+from message_io import open_message
+
+file_header = '''
+<n1:isfDataset crud="I" xsi:schemaLocation="http://www.asd-europe.org/s-series/s5000f ../00_XSD_Version_2.0/s5000f_2-0_isfdataset.xsd" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:n1="http://www.asd-europe.org/s-series/s5000f"></n1:isfDataset>
+'''
+
+# bicycle described in serialPV element
+SERIAL_PV = {'prod_id': 'ASD/AIA Bike',
+             'prod_var_id': 'Mountain Bike',
+             'ser_pv_id': '46'}
+
+# number of trek points formatted at once by stream_message
+CHUNK_SIZE = 10000
+
+# mPointVal elements between two checkpoints of the offset index (see message_index.py)
+CHECKPOINT = 256
+
+# parser of mPointVal fragments built by mPointVals
+_fragment_parser = etree.XMLParser(huge_tree=True)
+
+# measurement points: (mPointId, TrackPoints column, unit)
+MPOINTS = [('BIKE GPS LATITUDE', 'latitude', 'DGR'),
+           ('BIKE GPS LONGITUDE', 'longitude', 'DGR'),
+           ('BIKE GPS ELEVATION', 'elevation', 'MR'),
+           ('CYCLIST HEART RATE', 'heart_rate', '/MIN'),
+           ('BIKE CADENCE', 'cadence', '/MIN')]
+
+
+# Define pos_hash function which return a positive hash number
+# The hash is a keyed BLAKE2 digest: uids are the same at each Python runtime (no PYTHONHASHSEED
+# needed) and for each platform. The key can be set with environment variable S5000F_UID_KEY.
+UID_KEY = os.environ.get('S5000F_UID_KEY', 'ASD/AIA S5000F Bicycle Example').encode('utf-8')
+
+
+def pos_hash(s):
+    h = hashlib.blake2b(s.encode('utf-8'), digest_size=8, key=UID_KEY).digest()
+    return str(int.from_bytes(h, 'big') & sys.maxsize)
+
+
+def new_message():
+    '''Create message tree with its root <n1:isfDataset> (XML schema reference)'''
+    xsd = etree.fromstring(file_header)     # create an element xsd from string 'file_header'
+    message = etree.ElementTree(xsd)        # create a document tree by inserting xsd as element
+    return message
+
+
+# Function Message_Header(msg_date,msg_time,msg_type,msg_id,msg_status):
+# inputs:
+#    (string)     msg_date      : message creation date
+#    (string)     msg_time      : message creation time
+#    (string)     msg_type      : message type
+#    (string)     msg_id        : message identifier
+#    (string)     msg_status    : message status
+# output:
+#    (string)     xml           : xml snippet containing header data
+
+def Message_Header(msg_date, msg_time, msg_type, msg_id, msg_status):
+    xml  = "<HEADER>"
+    xml += "<!-- ======================== MESSAGE HEADER ========================== -->"
+    xml += "<msgId><id>" + msg_id + "</id></msgId>"
+    xml += "<msgDate><date>" + msg_date + "</date>"
+    xml += "<time>" + msg_time + "</time></msgDate>"
+    xml += "<msgStatus><state>" + msg_status + "</state></msgStatus>"
+    xml += "<msgType><code>" + msg_type + "</code></msgType></HEADER>"
+    return xml
+
+
+def add_header(root, msg_date, msg_time, msg_type, msg_id, msg_status):
+    '''
+    Insert message header as children of root and set uid attribute of root
+    Output: message uid
+    '''
+    header = etree.fromstring(Message_Header(msg_date, msg_time, msg_type, msg_id, msg_status))
+    for child in header:                    # insert children of HEADER as child of root
+        root.append(child)
+    msg_uid = 'msg' + pos_hash(msg_id)
+    root.set('uid', msg_uid)
+    return msg_uid
+
+
+def add_serialPV(parent, prod_id, prod_var_id, ser_pv_id):
+    '''
+    Create bicycle element serialPV as child of parent (element uc50902)
+    Output: element mpoints, to be filled with measurement points
+    '''
+    serialPV = etree.SubElement(parent, 'serialPV')
+    serialPV.set('uid', 'serialPV' + pos_hash(prod_id + ':' + prod_var_id + ':' + ser_pv_id))
+    prodId = etree.SubElement(serialPV, 'prodId')
+    etree.SubElement(prodId, 'id').text = prod_id                   # serialPV/prodId/id
+    prodVarId = etree.SubElement(serialPV, 'prodVarId')
+    etree.SubElement(prodVarId, 'id').text = prod_var_id            # serialPV/prodVarId/id
+    serPVId = etree.SubElement(serialPV, 'serPVId')
+    etree.SubElement(serPVId, 'id').text = ser_pv_id                # serialPV/serPVId/id
+    return etree.SubElement(serialPV, 'mpoints')
+
+
+def valid_values(values):
+    '''Mask of measurement values which are not missing (NaN or trackpoints.MISSING_INT)'''
+    if np.issubdtype(values.dtype, np.floating):
+        return ~np.isnan(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values >= 0
+    return np.ones(len(values), dtype=bool)
+
+
+def value_strings(values):
+    '''
+    Format measurement values as text, shortest text reading back as the same value of
+    the array type (float64 latitude, float32 elevation, ...)
+    Output: (valid, strings) where valid is the mask of values which are not
+            missing (NaN or trackpoints.MISSING_INT)
+    '''
+    values = np.asarray(values)
+    return valid_values(values), values.astype(str)
+
+
+def format_recdates(dates, times):
+    '''
+    Format once the beginning of each mPointVal (recording date and time, vdtm)
+    Inputs: arrays of strings 'YYYY-MM-DD' and 'hh:mm:ss' (see TrackPoints.date_time_strings)
+    Output: list of strings, shared by all measurement points of a trek
+    '''
+    return [f'<mPointVal><recDate><date>{d}</date><time>{t}</time></recDate><vdtm>MEAS</vdtm>'
+            for d, t in zip(dates.tolist(), times.tolist())]
+
+
+def mPointVals(recdates, values, unit_name):
+    '''
+    XML text of all mPointVal elements of a measurement point
+    Inputs:
+        ** recdates: beginning of each mPointVal (see format_recdates)
+        ** values: array of usage information, missing values are not reported
+        ** unit_name: unit of values
+    Output: string
+    '''
+    valid, strings = value_strings(values)
+    middle = '<unit>' + escape(unit_name) + '</unit><value>'
+    if valid.all():
+        pairs = zip(recdates, strings.tolist())
+    else:
+        pairs = ((r, v) for r, v, ok in zip(recdates, strings.tolist(), valid.tolist()) if ok)
+    return ''.join([f'{r}{middle}{v}</value></mPointVal>' for r, v in pairs])
+
+
+# mPoint create element <mPoint> as child of element <mpoints>
+def mPoint(mpoints, mPoint_id_val, dates, times, values, unit_name, recdates=None):
+    # mPoint_id_val is identifier of mPoint to be stored in mPointId/id
+    # dates, times are arrays of strings giving date and time of each value
+    # values is array of usage information, missing values are not reported
+    # recdates (see format_recdates) can be given to share date/time formatting between mPoints
+    # All mPointVal elements are created at once by parsing their text (see mPointVals)
+
+    if recdates is None:
+        recdates = format_recdates(dates, times)
+    mPoint = etree.fromstring('<mPoint>' + mPointVals(recdates, values, unit_name) + '</mPoint>',
+                              _fragment_parser)
+    mPoint_uid = 'mpoint' + pos_hash(mPoint_id_val)
+    mPoint.set('uid', mPoint_uid)
+    mPoint.insert(0, _id_element('mPointId', mPoint_id_val))
+    mpoints.append(mPoint)
+    return mPoint
+
+
+# Function Message_Trailer(msg_project,msg_sender,msg_receiver,msg_remarks,msg_classif):
+# inputs:
+#    (string)     msg_project     : message issued within project / context
+#    (string)     msg_sender      : sender of message
+#    (string)     msg_receiver    : receiver of message
+#    (string)     msg_remarks     : remarks about message
+#    (string)     msg_classif     : message classification
+# output:
+#    (string)     xml             : xml snippet containing trailer data
+
+def Message_Trailer(msg_project, msg_sender, msg_receiver, msg_remarks, msg_classif):
+    xml  = "<TRAILER><!-- ======================== MESSAGE TRAILER ========================== -->"
+    xml += "<msgContext><context><projRef><projId><id>" + msg_project + "</id></projId>"
+    xml += "</projRef></context></msgContext>"
+    xml += "<msgPty><ptyType><code>S</code></ptyType><party><persRef><persId><id>" + msg_sender
+    xml += "</id></persId></persRef></party></msgPty>"
+    xml += "<msgPty><ptyType><code>R</code></ptyType><party><persRef><persId><id>" + msg_receiver
+    xml += "</id></persId></persRef></party></msgPty>"
+    xml += "<rmks><rmk><text><descr>" + msg_remarks + "</descr></text></rmk></rmks>"
+    xml += "<secs><sec><secClassDefRef><secClass><name>" + msg_classif
+    xml += "</name></secClass></secClassDefRef></sec></secs></TRAILER>"
+    return xml
+
+
+def add_trailer(root, msg_project, msg_sender, msg_receiver, msg_remarks, msg_classif):
+    '''Insert message trailer as children of root'''
+    trailer = etree.fromstring(Message_Trailer(msg_project, msg_sender, msg_receiver,
+                                               msg_remarks, msg_classif))
+    for child in trailer:                   # insert children of TRAILER as child of root
+        root.append(child)
+
+
+def build_message(trek, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS):
+    '''
+    Create message UC50902 for trek points
+    Inputs:
+        ** trek: TrackPoints
+        ** header: dictionary of add_header arguments (msg_date, msg_time, msg_type, msg_id, msg_status)
+        ** trailer: dictionary of add_trailer arguments (msg_project, msg_sender, msg_receiver,
+                    msg_remarks, msg_classif)
+        ** serial_pv: dictionary of add_serialPV arguments (prod_id, prod_var_id, ser_pv_id)
+        ** mpoints: list of measurement points (mPointId, TrackPoints column, unit)
+    Output: message element tree
+    '''
+    message = new_message()
+    root = message.getroot()
+    add_header(root, **header)
+    uc50902 = etree.SubElement(root, 'uc50902')
+    mpoints_elt = add_serialPV(uc50902, **serial_pv)
+    dates, times = trek.date_time_strings()
+    recdates = format_recdates(dates, times)        # shared by all measurement points
+    for mPoint_id_val, column, unit_name in mpoints:
+        mPoint(mpoints_elt, mPoint_id_val, dates, times, getattr(trek, column), unit_name, recdates)
+    add_trailer(root, **trailer)
+    return message
+
+
+def write_message(message, path):
+    '''Store message element tree in xml file path (compressed if named *.xml.gz or *.xml.zst)'''
+    with open_message(path, 'wb') as message_file:
+        message_file.write(etree.tostring(message, pretty_print=False, xml_declaration=True,
+                                          encoding='UTF-8'))
+
+
+def message_shell(header, trailer):
+    '''
+    Serialized message without content
+    Output: (message uid, bytes before uc50902 content, bytes after uc50902 content)
+    '''
+    message = new_message()
+    root = message.getroot()
+    msg_uid = add_header(root, **header)
+    etree.SubElement(root, 'uc50902')
+    add_trailer(root, **trailer)
+    prefix, suffix = etree.tostring(message, pretty_print=False, xml_declaration=True,
+                                    encoding='UTF-8').split(b'<uc50902/>')
+    return msg_uid, prefix + b'<uc50902>', b'</uc50902>' + suffix
+
+
+def _id_element(tag, text):
+    '''Element <tag><id>text</id></tag>'''
+    element = etree.Element(tag)
+    etree.SubElement(element, 'id').text = text
+    return element
+
+
+def stream_serialPV(xf, trek, prod_id, prod_var_id, ser_pv_id, mpoints=MPOINTS,
+                    chunk_size=CHUNK_SIZE):
+    '''
+    Write element serialPV and its measurement points into xmlfile context xf
+    Trek points are formatted chunk_size at a time and each mPointVal is written
+    as soon as it is filled.
+    '''
+    uid = 'serialPV' + pos_hash(prod_id + ':' + prod_var_id + ':' + ser_pv_id)
+    with xf.element('serialPV', uid=uid):
+        xf.write(_id_element('prodId', prod_id))
+        xf.write(_id_element('prodVarId', prod_var_id))
+        xf.write(_id_element('serPVId', ser_pv_id))
+        with xf.element('mpoints'):
+            for mPoint_id_val, column, unit_name in mpoints:
+                stream_mPoint(xf, trek, mPoint_id_val, column, unit_name, chunk_size)
+
+
+def stream_mPoint(xf, trek, mPoint_id_val, column, unit_name, chunk_size=CHUNK_SIZE):
+    '''Write element mPoint for TrackPoints column into xmlfile context xf'''
+    with xf.element('mPoint', uid='mpoint' + pos_hash(mPoint_id_val)):
+        xf.write(_id_element('mPointId', mPoint_id_val))
+        for start in range(0, len(trek), chunk_size):
+            chunk = trek[start:start + chunk_size]
+            recdates = format_recdates(*chunk.date_time_strings())
+            fragment = etree.fromstring('<mPoint>' + mPointVals(recdates, getattr(chunk, column),
+                                                                unit_name) + '</mPoint>',
+                                        _fragment_parser)
+            for mPointVal in fragment:
+                xf.write(mPointVal)
+
+
+def stream_message(trek, path, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS,
+                   chunk_size=CHUNK_SIZE):
+    '''
+    Write message UC50902 for trek points incrementally into xml file path
+    Inputs: see build_message, chunk_size is the number of trek points formatted at once
+    Output: message uid
+    The file content is the same as write_message(build_message(...), path).
+    '''
+    msg_uid, prefix, suffix = message_shell(header, trailer)
+    with open_message(path, 'wb') as fd:
+        fd.write(prefix)
+        with etree.xmlfile(fd, encoding='UTF-8') as xf:
+            stream_serialPV(xf, trek, mpoints=mpoints, chunk_size=chunk_size, **serial_pv)
+        fd.write(suffix)
+    return msg_uid
+
+
+# byte templates of fast_message: a mPointVal is RECDATE (date and time filled in place),
+# then VALUE_START % unit, the value and VALUE_END
+RECDATE = b'<mPointVal><recDate><date>YYYY-MM-DD</date><time>hh:mm:ss</time></recDate><vdtm>MEAS</vdtm>'
+VALUE_START = b'<unit>%s</unit><value>'
+VALUE_END = b'</value></mPointVal>'
+_RECDATE = np.frombuffer(RECDATE, dtype=np.uint8)
+_DATE = RECDATE.index(b'YYYY-MM-DD')
+_TIME = RECDATE.index(b'hh:mm:ss')
+
+# size of bytearray flushed to the output file by fast_message
+BUFFER_SIZE = 1 << 20
+
+
+def xml_text(text):
+    '''Text escaped and encoded as in lxml serialization'''
+    return escape(text, {'\r': '&#13;'}).encode('utf-8')
+
+
+def xml_attribute(text):
+    '''Attribute value escaped and encoded as in lxml serialization'''
+    return escape(text, {'"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#9;'}).encode('utf-8')
+
+
+def _digits(rows, column, values, width):
+    '''Write integer values as width ASCII digits into rows[:, column:column + width]'''
+    for k in range(width - 1, -1, -1):
+        rows[:, column + k] = 48 + values % 10
+        values = values // 10
+
+
+def recdate_bytes(timestamp):
+    '''
+    Fill the RECDATE template for each trek point, without python loop nor string conversion
+    Input: array of timestamps in ns since epoch (TrackPoints.timestamp)
+    Output: array of fixed size bytes, shared by all measurement points
+    Date and time are the same as TrackPoints.date_time_strings (UTC, truncated to the second).
+    '''
+    seconds = np.asarray(timestamp, dtype=np.int64) // 10 ** 9
+    days, day_seconds = np.divmod(seconds, 86400)
+    # civil date from days since 1970-01-01 (proleptic gregorian calendar, see
+    # http://howardhinnant.github.io/date_algorithms.html#civil_from_days)
+    era, doe = np.divmod(days + 719468, 146097)
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+
+    rows = np.empty((len(seconds), len(RECDATE)), dtype=np.uint8)
+    rows[:] = _RECDATE
+    _digits(rows, _DATE, year, 4)
+    _digits(rows, _DATE + 5, month, 2)
+    _digits(rows, _DATE + 8, day, 2)
+    hours, minutes = np.divmod(day_seconds // 60, 60)
+    _digits(rows, _TIME, hours, 2)
+    _digits(rows, _TIME + 3, minutes, 2)
+    _digits(rows, _TIME + 6, day_seconds % 60, 2)
+    return rows.view('S%d' % len(RECDATE)).ravel()
+
+
+def value_bytes(values):
+    '''
+    Format measurement values as bytes, same text as value_strings
+    Repeated values (elevation, heart rate, cadence) are formatted once.
+    Output: (valid, strings) for the valid values only (see value_strings)
+    '''
+    values = np.asarray(values)
+    valid = valid_values(values)
+    if not valid.all():
+        values = values[valid]
+    keys = values.view('u%d' % values.itemsize) if values.dtype.kind == 'f' else values  # -0.0 != 0.0
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    if len(first) < len(values) // 2:
+        return valid, values[first].astype('S')[inverse.ravel()]
+    return valid, values.astype('S')
+
+
+def mPointVal_bytes(recdates, values, unit_name, sizes=None):
+    '''
+    Bytes of all mPointVal elements of a measurement point (see mPointVals)
+    Inputs: recdates (see recdate_bytes), values and unit_name as in mPointVals
+    If sizes is a list, the array of sizes in bytes of the mPointVal elements is appended to it.
+    '''
+    valid, strings = value_bytes(values)
+    if len(strings) < len(recdates):
+        recdates = recdates[valid]
+    middle = VALUE_START % xml_text(unit_name)
+    if sizes is not None:
+        sizes.append(len(RECDATE) + len(middle) + len(VALUE_END) + np.char.str_len(strings))
+    parts = [None, middle, None, VALUE_END] * len(strings)
+    parts[0::4] = recdates.tolist()
+    parts[2::4] = strings.tolist()
+    return b''.join(parts)
+
+
+def _id_bytes(tag, text):
+    '''Bytes of element <tag><id>text</id></tag>'''
+    return b'<%s><id>%s</id></%s>' % (tag, xml_text(text), tag)
+
+
+def mPointVal_chunks(trek, column, unit_name, chunk_size=CHUNK_SIZE, checkpoints=None,
+                     count=0, every=CHECKPOINT):
+    '''
+    Bytes of the mPointVal elements of TrackPoints column, chunk_size trek points at a time
+    If checkpoints is a list, [offset, recording date in ns] of every `every`-th mPointVal is
+    appended to it, offsets counted from the first byte yielded, count being the number of
+    mPointVal elements already written in the mPoint.
+    '''
+    offset = 0
+    for start in range(0, len(trek), chunk_size):
+        values = getattr(trek, column)[start:start + chunk_size]
+        timestamp = trek.timestamp[start:start + chunk_size]
+        valid = valid_values(values)
+        if not valid.all():                         # dates of missing values are not formatted
+            values, timestamp = values[valid], timestamp[valid]
+        if checkpoints is None:
+            yield mPointVal_bytes(recdate_bytes(timestamp), values, unit_name)
+            continue
+        sizes = []
+        chunk = mPointVal_bytes(recdate_bytes(timestamp), values, unit_name, sizes)
+        starts = offset + np.cumsum(sizes[0]) - sizes[0]
+        picks = np.arange(-count % every, len(starts), every)
+        recdates = np.asarray(timestamp)[picks] // 10 ** 9 * 10 ** 9    # truncated as recDate
+        checkpoints.extend(zip(starts[picks].tolist(), recdates.tolist()))
+        count += len(starts)
+        offset += len(chunk)
+        yield chunk
+
+
+def write_serialPV(fd, trek, prod_id, prod_var_id, ser_pv_id, mpoints=MPOINTS,
+                   chunk_size=CHUNK_SIZE, buffer=None, buffer_size=BUFFER_SIZE, index=None):
+    '''
+    Write element serialPV and its measurement points into binary file fd with byte templates
+    Bytes are accumulated in buffer (a bytearray, reused between calls when given) and
+    written to fd each time it holds more than buffer_size bytes.
+    If index is a list, an entry is appended for each mPoint (see message_index.py), with
+    offsets (checkpoints included) counted from the beginning of serialPV.
+    '''
+    buf = bytearray() if buffer is None else buffer
+    flushed = 0                                     # bytes written to fd
+    uid = 'serialPV' + pos_hash(prod_id + ':' + prod_var_id + ':' + ser_pv_id)
+    buf += b'<serialPV uid="%s">' % xml_attribute(uid)
+    buf += _id_bytes(b'prodId', prod_id)
+    buf += _id_bytes(b'prodVarId', prod_var_id)
+    buf += _id_bytes(b'serPVId', ser_pv_id)
+    if not mpoints:
+        buf += b'<mpoints/>'
+    else:
+        buf += b'<mpoints>'
+        for mPoint_id_val, column, unit_name in mpoints:
+            start = flushed + len(buf)
+            buf += b'<mPoint uid="%s">' % xml_attribute('mpoint' + pos_hash(mPoint_id_val))
+            buf += _id_bytes(b'mPointId', mPoint_id_val)
+            first = flushed + len(buf)
+            checkpoints = None if index is None else []
+            for chunk in mPointVal_chunks(trek, column, unit_name, chunk_size, checkpoints):
+                buf += chunk
+                if len(buf) > buffer_size:
+                    fd.write(buf)
+                    flushed += len(buf)
+                    del buf[:]
+            if index is not None:
+                index.append({'serial': ser_pv_id, 'id': mPoint_id_val, 'column': column,
+                              'unit': unit_name, 'start': start, 'end': flushed + len(buf),
+                              'last': int(trek.timestamp[-1]) if len(trek) else None,
+                              'count': int(valid_values(getattr(trek, column)).sum()),
+                              'checkpoints': [[first + offset, recdate]
+                                              for offset, recdate in checkpoints]})
+            buf += b'</mPoint>'
+        buf += b'</mpoints>'
+    buf += b'</serialPV>'
+    fd.write(buf)
+    del buf[:]
+
+
+def fast_message(trek, path, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS,
+                 chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE, verify=False, index=False):
+    '''
+    Write message UC50902 for trek points into xml file path with byte templates
+    Inputs: see stream_message
+        ** buffer_size: size of file buffer and of the bytearray flushed into it
+        ** verify: if True, compare the file with write_message(build_message(...))
+        ** index: if True, write the offset index of the message next to it (uncompressed
+                  message only), used to append values in place (see message_index.py)
+    Output: message uid
+    Raise ValueError if verify is True and the files differ, or if index is True and the
+    message is compressed (checked before the file is written).
+    '''
+    if index:
+        import message_index                       # message_index imports this module
+        message_index.check_uncompressed(path)
+    msg_uid, prefix, suffix = message_shell(header, trailer)
+    entries = [] if index else None
+    with open_message(path, 'wb', buffering=buffer_size) as fd:     # io.BufferedWriter
+        fd.write(prefix)
+        write_serialPV(fd, trek, mpoints=mpoints, chunk_size=chunk_size,
+                       buffer=bytearray(), buffer_size=buffer_size, index=entries, **serial_pv)
+        fd.write(suffix)
+    if index:
+        entries = [message_index.shift_entry(entry, len(prefix)) for entry in entries]
+        message_index.save_index(path, msg_uid, entries)
+    if verify:
+        verify_message(path, trek, header, trailer, serial_pv, mpoints)
+    return msg_uid
+
+
+def verify_message(path, trek, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS):
+    '''
+    Compare xml file path with the message built by lxml for the same trek points
+    Raise ValueError giving the offset of the first difference.
+    '''
+    expected = etree.tostring(build_message(trek, header, trailer, serial_pv, mpoints),
+                              pretty_print=False, xml_declaration=True, encoding='UTF-8')
+    with open_message(path) as fd:
+        written = fd.read()
+    if written != expected:
+        offset = next((i for i, (a, b) in enumerate(zip(written, expected)) if a != b),
+                      min(len(written), len(expected)))
+        raise ValueError(f"{path}: differs from lxml message at byte {offset}: "
+                         f"{written[offset:offset + 60]!r} instead of {expected[offset:offset + 60]!r}")
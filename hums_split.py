@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Splitting of a trek into several S5000F messages UC50902.
+
+Receivers reject or time out on very large messages (multi-day rides). A trek
+is cut into consecutive parts bounded by:
+    max_values  maximum number of mPointVal elements per message
+    max_bytes   maximum size of message file (uncompressed)
+    window      time window (pandas timedelta string, e.g. '1h'): a part never
+                spans two windows, windows being aligned on the trek start
+Each part is a complete message with its own header (msg_id suffixed with
+the part number, hence its own stable uid) and trailer (remarks give the part
+number); a trek that fits in one part gives the same message as fast_message.
+Parts are written concurrently in a process pool with hums_message.fast_message,
+and a manifest (manifest.json) links them in time order (previous / next uid).
+'''
+
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import hums_message
+from hums_message import CHUNK_SIZE, MPOINTS, SERIAL_PV
+
+
+def part_header(header, part, n_parts):
+    '''Header of message part (1 based) out of n_parts, unchanged for a single part'''
+    if n_parts == 1:
+        return header
+    return dict(header, msg_id=f"{header['msg_id']} part {part} of {n_parts}")
+
+
+def part_trailer(trailer, part, n_parts):
+    '''Trailer of message part (1 based) out of n_parts, unchanged for a single part'''
+    if n_parts == 1:
+        return trailer
+    return dict(trailer, msg_remarks=f"{trailer['msg_remarks']} (part {part} of {n_parts})")
+
+
+def value_sizes(trek, mpoints=MPOINTS, chunk_size=CHUNK_SIZE):
+    '''
+    Number of mPointVal elements and their size in bytes for each trek point
+    Output: (counts, sizes) int64 arrays, summed over measurement points
+    '''
+    counts = np.zeros(len(trek), dtype=np.int64)
+    sizes = np.zeros(len(trek), dtype=np.int64)
+    for _, column, unit_name in mpoints:
+        fixed = (len(hums_message.RECDATE) + len(hums_message.VALUE_END)
+                 + len(hums_message.VALUE_START % hums_message.xml_text(unit_name)))
+        for start in range(0, len(trek), chunk_size):
+            valid, strings = hums_message.value_bytes(getattr(trek, column)[start:start + chunk_size])
+            pos = start + np.flatnonzero(valid)
+            counts[pos] += 1
+            sizes[pos] += fixed + np.char.str_len(strings)
+    return counts, sizes
+
+
+def message_overhead(header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS, max_parts=99999):
+    '''Size in bytes of a message part without any mPointVal (upper bound over part numbers)'''
+    _, prefix, suffix = hums_message.message_shell(part_header(header, max_parts, max_parts),
+                                                   part_trailer(trailer, max_parts, max_parts))
+    fd = io.BytesIO()
+    hums_message.write_serialPV(fd, [], mpoints=mpoints, **serial_pv)
+    return len(prefix) + len(suffix) + fd.tell()
+
+
+def split_bounds(trek, max_values=None, max_bytes=None, window=None, header=None, trailer=None,
+                 serial_pv=SERIAL_PV, mpoints=MPOINTS):
+    '''
+    Cut trek points into consecutive parts
+    Inputs:
+        ** trek: TrackPoints, sorted by time
+        ** max_values, max_bytes, window: limits of each part (None: no limit), see module doc
+        ** header, trailer: message header and trailer (needed by max_bytes only)
+    Output: list of (start, end) positions of parts in trek
+    A part holds at least one trek point, even if its values exceed max_values or max_bytes.
+    '''
+    n = len(trek)
+    if n == 0:
+        return [(0, 0)]
+    # window segments: parts never cross them
+    if window is None:
+        segments = [0, n]
+    else:
+        window_index = (trek.timestamp - trek.timestamp[0]) // pd.to_timedelta(window).value
+        segments = [0] + (np.flatnonzero(np.diff(window_index)) + 1).tolist() + [n]
+
+    limits = []
+    if max_values is not None or max_bytes is not None:
+        counts, sizes = value_sizes(trek, mpoints)
+        if max_values is not None:
+            limits.append((np.concatenate(([0], np.cumsum(counts))), max_values))
+        if max_bytes is not None:
+            budget = max_bytes - message_overhead(header, trailer, serial_pv, mpoints)
+            limits.append((np.concatenate(([0], np.cumsum(sizes))), budget))
+
+    bounds = []
+    for first, last in zip(segments[:-1], segments[1:]):
+        start = first
+        while start < last:
+            end = last
+            for cumulated, limit in limits:
+                # last end such that cumulated[end] - cumulated[start] <= limit
+                end = min(end, np.searchsorted(cumulated, cumulated[start] + limit, 'right') - 1)
+            end = max(int(end), start + 1)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def write_part(trek, path, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS):
+    '''
+    Write one message part (run in a worker process)
+    Output: manifest entry of the part (dictionary)
+    '''
+    msg_uid = hums_message.fast_message(trek, path, header, trailer, serial_pv, mpoints)
+    entry = {'uid': msg_uid, 'msg_id': header['msg_id'], 'file': path,
+             'points': len(trek), 'bytes': os.path.getsize(path)}
+    if len(trek):
+        entry['start'] = str(trek.datetime[0])
+        entry['end'] = str(trek.datetime[-1])
+    return entry
+
+
+def split_messages(trek, folder, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS,
+                   max_values=None, max_bytes=None, window=None, workers=None, suffix='.xml'):
+    '''
+    Write trek points as several messages UC50902 into folder
+    Inputs:
+        ** trek: TrackPoints
+        ** folder: output folder (created if needed), message files are named <uid><suffix>
+        ** header, trailer, serial_pv, mpoints: see hums_message.build_message
+        ** max_values, max_bytes, window: limits of each message, see module doc
+        ** workers: number of worker processes (default: number of cores)
+        ** suffix: '.xml', or '.xml.gz' / '.xml.zst' for compressed messages (see message_io.py)
+    Output: manifest (dictionary), also stored in <folder>/manifest.json
+    '''
+    os.makedirs(folder, exist_ok=True)
+    start = time.perf_counter()
+    bounds = split_bounds(trek, max_values, max_bytes, window, header, trailer, serial_pv, mpoints)
+    n_parts = len(bounds)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for part, (first, last) in enumerate(bounds, 1):
+            part_hdr = part_header(header, part, n_parts)
+            path = os.path.join(folder, f'part-{part}{suffix}')
+            futures.append(pool.submit(write_part, trek[first:last], path, part_hdr,
+                                       part_trailer(trailer, part, n_parts), serial_pv, mpoints))
+        parts = [future.result() for future in futures]
+
+    for part, entry in enumerate(parts, 1):
+        path = os.path.join(folder, entry['uid'] + suffix)
+        os.replace(entry['file'], path)
+        entry.update(part=part, file=path,
+                     previous=parts[part - 2]['uid'] if part > 1 else None,
+                     next=parts[part]['uid'] if part < n_parts else None)
+    manifest = {'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+                'msg_id': header['msg_id'],
+                'parts': n_parts,
+                'points': len(trek),
+                'limits': {'max_values': max_values, 'max_bytes': max_bytes,
+                           'window': None if window is None else str(window)},
+                'seconds': round(time.perf_counter() - start, 4),
+                'messages': parts}
+    with open(os.path.join(folder, 'manifest.json'), 'w') as fd:
+        json.dump(manifest, fd, indent=2)
+    return manifest
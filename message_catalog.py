@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Persistent catalog of S5000F message headers (SQLite).
+
+Header and trailer information of message files (see message_header.py) is
+stored in table messages, one row per file, with the file path, size,
+modification time and content hash. Columns used to search messages are
+indexed, so that a query does not read any message file.
+
+update() is incremental: a file whose size and modification time did not
+change is skipped, a file whose content hash did not change only gets its
+modification time updated, and files which disappeared from the scanned
+folders are removed from the catalog. A file which cannot be read is kept
+with its error, and read again only when it changes.
+
+Usage:
+    python message_catalog.py update <folder or glob> [...] [--db catalog]
+    python message_catalog.py query --sender <sender> --context <context> --since 2020-04-09
+'''
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from file_utils import file_hash
+from message_header import read_header
+from message_io import list_message_files
+
+CATALOG = '.message_catalog.sqlite'
+
+# message header columns: catalog column: Header.dict key
+HEADER_COLUMNS = {'uid': 'uid', 'id': 'id', 'type': 'type', 'date': 'date', 'time': 'time',
+                  'status': 'status', 'sender': 'sender', 'receiver': 'receiver',
+                  'context': 'context', 'classification': 'classif'}
+COLUMNS = ('path',) + tuple(HEADER_COLUMNS) + ('size', 'mtime', 'hash', 'error')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    path TEXT PRIMARY KEY,
+    uid TEXT, id TEXT, type TEXT, date TEXT, time TEXT, status TEXT,
+    sender TEXT, receiver TEXT, context TEXT, classification TEXT,
+    size INTEGER, mtime INTEGER, hash TEXT, error TEXT);
+CREATE INDEX IF NOT EXISTS messages_uid ON messages (uid);
+CREATE INDEX IF NOT EXISTS messages_type ON messages (type, date);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender, date);
+CREATE INDEX IF NOT EXISTS messages_receiver ON messages (receiver, date);
+CREATE INDEX IF NOT EXISTS messages_context ON messages (context, date);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date, time);
+'''
+
+
+class MessageCatalog():
+    '''
+    Catalog of message headers (see module doc)
+    Input: path of SQLite database (created if needed)
+    '''
+    def __init__(self, path=CATALOG):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def __contains__(self, path):
+        return self.connection.execute('SELECT 1 FROM messages WHERE path = ?',
+                                       (os.path.abspath(path),)).fetchone() is not None
+
+    def update(self, inputs, prune=True):
+        '''
+        Add or refresh message files in the catalog
+        Inputs:
+            ** inputs: folder, glob pattern or list of them (see message_io.list_message_files)
+            ** prune: if True, remove catalog rows of files which no longer exist
+                      below the scanned folders
+        Output: counts (dictionary): added, updated, unchanged, removed, errors
+        '''
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'errors': 0}
+        files = [os.path.abspath(path) for path in list_message_files(inputs)]
+        known = {row['path']: row for row in
+                 self.connection.execute('SELECT path, size, mtime, hash FROM messages')}
+        with self.connection:
+            for path in files:
+                stat = os.stat(path)
+                row = known.get(path)
+                if row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime_ns:
+                    counts['unchanged'] += 1
+                    continue
+                digest = file_hash(path)
+                if row is not None and row['hash'] == digest:
+                    self.connection.execute('UPDATE messages SET mtime = ? WHERE path = ?',
+                                            (stat.st_mtime_ns, path))
+                    counts['unchanged'] += 1
+                    continue
+                record = dict.fromkeys(COLUMNS)
+                record.update(path=path, size=stat.st_size, mtime=stat.st_mtime_ns, hash=digest)
+                try:
+                    header = read_header(path)
+                    record.update({column: header[key] for column, key in HEADER_COLUMNS.items()})
+                except Exception as e:
+                    record['error'] = f"{type(e).__name__}: {e}"
+                    counts['errors'] += 1
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO messages ({', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                    [record[column] for column in COLUMNS])
+                counts['updated' if row is not None else 'added'] += 1
+
+            if prune:
+                scanned = set(files)
+                folders = [os.path.join(os.path.abspath(item), '') for item in
+                           ([inputs] if isinstance(inputs, (str, os.PathLike)) else inputs)
+                           if os.path.isdir(item)]
+                for path in known:
+                    if path not in scanned and path.startswith(tuple(folders)) \
+                            and not os.path.exists(path):
+                        self.connection.execute('DELETE FROM messages WHERE path = ?', (path,))
+                        counts['removed'] += 1
+        return counts
+
+    def query(self, since=None, until=None, errors=False, **criteria):
+        '''
+        Catalog rows of messages matching all criteria
+        Inputs:
+            ** since, until: first and last message date (YYYY-MM-DD), None for no bound
+            ** errors: if True, files which could not be read are also returned
+            ** criteria: column=value (uid, id, type, status, sender, receiver, context,
+                         classification, hash)
+        Output: list of dictionaries (COLUMNS), sorted by message date and time
+        '''
+        clauses, parameters = [], []
+        for column, value in criteria.items():
+            if column not in COLUMNS:
+                raise ValueError(f"unknown catalog column {column!r}")
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                parameters.append(value)
+        if since is not None:
+            clauses.append('date >= ?')
+            parameters.append(str(pd.Timestamp(since).date()))
+        if until is not None:
+            clauses.append('date <= ?')
+            parameters.append(str(pd.Timestamp(until).date()))
+        if not errors:
+            clauses.append('error IS NULL')
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ''
+        rows = self.connection.execute(f"SELECT * FROM messages {where}ORDER BY date, time, path",
+                                       parameters)
+        return [dict(row) for row in rows]
+
+    def dataframe(self, **criteria):
+        '''Catalog rows matching criteria (see query) as a pandas DataFrame'''
+        return pd.DataFrame(self.query(**criteria), columns=list(COLUMNS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog of S5000F message headers")
+    parser.add_argument('--db', default=CATALOG, help="catalog database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser('update', help="add or refresh message files")
+    update.add_argument('inputs', nargs='+', help="folders or glob patterns of message files")
+    update.add_argument('--keep', action='store_true', help="keep rows of deleted files")
+    query = commands.add_parser('query', help="print matching messages as CSV")
+    for column in ('uid', 'id', 'type', 'status', 'sender', 'receiver', 'context',
+                   'classification'):
+        query.add_argument(f'--{column}', default=None)
+    query.add_argument('--since', default=None, help="first message date (YYYY-MM-DD)")
+    query.add_argument('--until', default=None, help="last message date (YYYY-MM-DD)")
+    query.add_argument('--errors', action='store_true', help="include unreadable files")
+    args = vars(parser.parse_args())
+
+    with MessageCatalog(args.pop('db')) as catalog:
+        command = args.pop('command')
+        if command == 'update':
+            counts = catalog.update(args['inputs'], prune=not args['keep'])
+            print(", ".join(f"{count} {name}" for name, count in counts.items()))
+        else:
+            writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(catalog.query(**args))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Reader of the content of S5000F messages UC50902.
+
+uc50902/serialPV/mpoints/mPoint/mPointVal elements are stream-parsed
+(etree.iterparse). mPointVal elements are read by batches of BATCH elements
+(one XPath query per field), then deleted, so that memory is bounded by the
+size of the returned arrays, not by the size of the message.
+Plain and compressed messages are accepted (see message_io.py).
+
+For each measurement point (mPointId), read_content() returns:
+    serial      serial number of bike (serialPV/serPVId/id)
+    unit, vdtm  unit and value type of its first mPointVal
+    timestamp   array of recording dates (datetime64[ns])
+    value       array of values (float64)
+'''
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from message_io import open_message
+
+# mPointVal elements read at once
+BATCH = 4096
+
+# fields of the first $n mPointVal elements of a mPoint
+_DATES = etree.XPath('mPointVal[position() <= $n]/recDate/date/text()', smart_strings=False)
+_TIMES = etree.XPath('mPointVal[position() <= $n]/recDate/time/text()', smart_strings=False)
+_VALUES = etree.XPath('mPointVal[position() <= $n]/value/text()', smart_strings=False)
+
+
+def mpoint_values(mpoint, n):
+    '''
+    Recording dates and values of the first n mPointVal elements of element mpoint
+    Output: (timestamp, value) arrays, datetime64[ns] and float64
+    Raise ValueError if a mPointVal has no recording date or no value.
+    '''
+    dates, times, texts = _DATES(mpoint, n=n), _TIMES(mpoint, n=n), _VALUES(mpoint, n=n)
+    if not len(dates) == len(times) == len(texts):
+        raise ValueError("mPointVal without recording date or value")
+    # recording time is 'hh:mm:ss' or 'hh:mm:ss.f', with optional 'Z' (UTC) suffix
+    stamps = np.array([f'{d}T{t.rstrip("Z")}' for d, t in zip(dates, times)], dtype='datetime64[ns]')
+    return stamps, np.array(texts, dtype=np.float64)
+
+
+def read_content(path, mpoints=None, serial=None, dataframe=False, batch=BATCH):
+    '''
+    Measurement values of message UC50902 file path
+    Inputs:
+        ** path: pathname of message file (plain or compressed)
+        ** mpoints: list of mPointId to read, None for all
+        ** serial: serial number of bike (serialPV/serPVId/id), needed for fleet messages
+        ** dataframe: if True, return a pandas DataFrame (see content_dataframe)
+        ** batch: number of mPointVal elements held in memory
+    Output: dictionary {mPointId: measurement point} (see module doc)
+    Raise ValueError if the message reports several bikes and serial is None.
+    '''
+    selected = None if mpoints is None else set(mpoints)
+    result = {}
+    current_serial = mpoint_id = unit = vdtm = None
+    keep = False
+    stamps, values = [], []                             # arrays of each batch
+    count = 0
+
+    def flush(mpoint, current=None):
+        '''
+        Read then delete mPointVal elements of mpoint parsed up to current (all if None)
+        The tree may already hold the next elements, partly parsed: they are left as is, and
+        current is only cleared (the parser appends the next elements after it).
+        '''
+        nonlocal unit, vdtm
+        first = mpoint.find('mPointVal')
+        if first is None:
+            return
+        start = mpoint.index(first)
+        n = len(mpoint) - start if current is None else mpoint.index(current) - start + 1
+        if keep:
+            if unit is None:
+                unit, vdtm = first.findtext('unit'), first.findtext('vdtm')
+            try:
+                batch_stamps, batch_values = mpoint_values(mpoint, n)
+            except ValueError as e:
+                raise ValueError(f"{path}: {e} in mPoint {mpoint_id} "
+                                 f"after {sum(map(len, values))} values") from None
+            stamps.append(batch_stamps)
+            values.append(batch_values)
+        if current is None:
+            del mpoint[start:]
+        else:
+            current.clear()
+            del mpoint[start:start + n - 1]
+
+    with open_message(path) as fd:
+        context = etree.iterparse(fd, events=('end',), huge_tree=True,
+                                  tag=('serPVId', 'mPointId', 'mPointVal', 'mPoint', 'serialPV'))
+        for _, elem in context:
+            tag = elem.tag
+            if tag == 'mPointVal':
+                count += 1
+                if count >= batch:
+                    flush(elem.getparent(), elem)
+                    count = 0
+            elif tag == 'mPointId':
+                mpoint_id = elem.findtext('id')
+                unit = vdtm = None
+                stamps, values = [], []
+                keep = (selected is None or mpoint_id in selected) \
+                    and (serial is None or current_serial == serial)
+            elif tag == 'serPVId':
+                current_serial = elem.findtext('id')
+            else:                                       # mPoint or serialPV
+                if tag == 'mPoint':
+                    flush(elem)
+                    count = 0
+                    if keep:
+                        if serial is None and \
+                                result.get(mpoint_id, {}).get('serial', current_serial) != current_serial:
+                            raise ValueError(f"{path}: message reports several bikes, give serial")
+                        result[mpoint_id] = {
+                            'serial': current_serial, 'unit': unit, 'vdtm': vdtm,
+                            'timestamp': np.concatenate(stamps or [np.array([], 'datetime64[ns]')]),
+                            'value': np.concatenate(values or [np.array([], np.float64)])}
+                    keep = False
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    if dataframe:
+        return content_dataframe(result)
+    return result
+
+
+def content_dataframe(content):
+    '''
+    Measurement values of read_content as a pandas DataFrame
+    Output: one row per mPointVal, columns serial, mpoint, timestamp, value, unit and vdtm
+    '''
+    frames = [pd.DataFrame({'serial': point['serial'], 'mpoint': mpoint_id,
+                            'timestamp': point['timestamp'], 'value': point['value'],
+                            'unit': point['unit'], 'vdtm': point['vdtm']})
+              for mpoint_id, point in content.items()]
+    if not frames:
+        return pd.DataFrame(columns=['serial', 'mpoint', 'timestamp', 'value', 'unit', 'vdtm'])
+    frame = pd.concat(frames, ignore_index=True)
+    for column in ('serial', 'mpoint', 'unit', 'vdtm'):
+        frame[column] = frame[column].astype('category')
+    return frame
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Extraction of header and trailer information of S5000F messages.
+
+The message content (e.g. uc50902) is more than 99% of a message file, while
+header and trailer only hold about ten fields. read_header() reads them in a
+time which does not depend on the size of the content:
+    - header: the file is stream-parsed (etree.iterparse) until the first
+      element which is not a header element (the content) starts
+    - trailer: the file is mapped in memory (mmap) and scanned backwards for
+      the end tag of the content, the bytes after it are parsed
+Compressed messages (see message_io.py) cannot be mapped: they are
+decompressed up to the end without being parsed, only the last TAIL_SIZE bytes
+being kept and scanned backwards. The result is the same as with a full parse
+(fast=False).
+'''
+
+import mmap
+
+from lxml import etree
+
+from message_io import detect_compression, open_message
+
+# elements of message header
+HEADER_TAGS = ('msgId', 'msgDate', 'msgStatus', 'msgType')
+
+# decompressed bytes kept from the end of compressed messages to read their trailer
+TAIL_SIZE = 1 << 20
+
+_fragment_parser = etree.XMLParser(huge_tree=True)
+
+
+def header_fields(root):
+    '''
+    Header and trailer information of message root element
+    Output: dictionary (uid, id, type, date, time, status, context, classif, sender, receiver)
+    Exception if some metadata are missing. They are set has mandatory in XSD message envelope.
+    '''
+    parties = {}
+    for elt in root.xpath('./msgPty'):
+        parties[elt.xpath('./ptyType/code')[0].text] = elt.xpath('./party/persRef/persId/id')[0].text
+    return {'uid': root.attrib['uid'],
+            'id': root.xpath('./msgId/id')[0].text,
+            'type': root.xpath('./msgType/code')[0].text,
+            'date': root.xpath('./msgDate/date')[0].text,
+            'time': root.xpath('./msgDate/time')[0].text,
+            'status': root.xpath('./msgStatus/state')[0].text,
+            'context': root.xpath('./msgContext/context/projRef/projId/id')[0].text,
+            'classif': root.xpath('./secs/sec/secClassDefRef/secClass/name')[0].text,
+            'sender': parties['S'],
+            'receiver': parties['R']}
+
+
+def _trailer_elements(data, content_tag):
+    '''Trailer elements of message data (bytes or mmap), scanned backwards from its end'''
+    tag = content_tag.encode('utf-8')
+    end = data.rfind(b'</')                         # end tag of root element
+    start = data.rfind(b'</%s>' % tag, 0, end)
+    if start < 0:                                   # empty content
+        start = data.rfind(b'<%s/>' % tag, 0, end)
+        if start < 0:
+            raise ValueError(f"end of content element {content_tag} not found")
+    start += len(tag) + 3
+    return list(etree.fromstring(b'<trailer>' + data[start:end] + b'</trailer>', _fragment_parser))
+
+
+def _message_tail(fd, size=TAIL_SIZE):
+    '''Last bytes (at least size) of decompressed message stream fd'''
+    tail = b''
+    for chunk in iter(lambda: fd.read(size), b''):
+        tail = tail[-size:] + chunk
+    return tail
+
+
+def read_header(path, fast=True):
+    '''
+    Header and trailer information of message file path (plain or compressed)
+    Inputs:
+        ** path: pathname of message file
+        ** fast: if False, the whole message is parsed
+    Output: dictionary, see header_fields
+    '''
+    with open_message(path) as fd:
+        if not fast:
+            return header_fields(etree.parse(fd, _fragment_parser).getroot())
+
+        context = etree.iterparse(fd, events=('start', 'end'), huge_tree=True)
+        root, content, depth = None, None, 0
+        for event, elem in context:
+            if event == 'end':
+                depth -= 1
+                continue
+            depth += 1
+            if depth == 1:
+                root = elem
+            elif depth == 2 and elem.tag not in HEADER_TAGS:
+                content = elem
+                break
+        if content is None:                         # message without content
+            return header_fields(root)
+
+        header = etree.Element('message', uid=root.attrib['uid'])
+        for elt in root:
+            if elt.tag in HEADER_TAGS:
+                header.append(elt)
+        try:
+            if detect_compression(path) is None:
+                with open(path, 'rb') as raw, \
+                        mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    trailer = _trailer_elements(mm, content.tag)
+            else:
+                trailer = _trailer_elements(_message_tail(fd), content.tag)
+            for elt in trailer:
+                header.append(elt)
+            return header_fields(header)
+        except (ValueError, etree.XMLSyntaxError, IndexError, KeyError):
+            pass
+    # unexpected layout (e.g. trailer larger than TAIL_SIZE): full parse
+    return read_header(path, fast=False)
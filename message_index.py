@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Byte offset index of S5000F messages UC50902.
+
+The index of message <path> is stored next to it in <path>.idx (JSON):
+    uid       message uid
+    size      size of message file when the index was written (stale index check)
+    every     mPointVal elements between two checkpoints
+    mpoints   one entry per mPoint: serial (serialPV/serPVId/id), id (mPointId),
+              column (TrackPoints column, None if unknown), unit, start (offset
+              of '<mPoint'), end (offset of '</mPoint>'), last (timestamp in ns
+              of the last trek point reported, None if none), count (number of
+              mPointVal) and checkpoints ([offset of '<mPointVal', recording date
+              in ns] of every `every`-th mPointVal, the first one included)
+It is written by the generator (hums_message.fast_message(..., index=True) or
+hums_fleet.fleet_message(..., index=True)), or by build_index() with a single
+scan of an existing message.
+
+read_window() reads the values of one mPoint between two dates: checkpoints
+give the bytes holding them, only these bytes are read (mmap) and parsed.
+
+append_message() adds mPointVal elements at the end of each mPoint of an
+existing message: bytes before the first mPoint end are neither read nor
+rewritten, the following bytes are moved once, and the index is updated.
+'''
+
+import bisect
+import json
+import mmap
+import os
+import re
+from xml.sax.saxutils import unescape
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+import hums_message
+from message_content import mpoint_values
+from message_header import read_header
+from message_io import compression, detect_compression
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 2
+
+# scan of messages by build_index
+_MPOINT = re.compile(rb'<serPVId>\s*<id>([^<]*)</id>|<mPoint[\s>/]|</mPoint>')
+_MPOINT_ID = re.compile(rb'\s*<mPointId>\s*<id>([^<]*)</id>')
+_MPOINTVAL = re.compile(rb'<mPointVal[\s>]')
+_RECDATE = re.compile(rb'<mPointVal>\s*<recDate>\s*<date>([^<]*)</date>\s*<time>([^<]*)</time>')
+_UNIT = re.compile(rb'<unit>([^<]*)</unit>')
+
+_fragment_parser = etree.XMLParser(huge_tree=True)
+
+
+def index_path(path):
+    '''Pathname of the offset index of message file path'''
+    return str(path) + INDEX_SUFFIX
+
+
+def shift_entry(entry, delta):
+    '''Copy of index entry with its offsets (checkpoints included) moved by delta bytes'''
+    return dict(entry, start=entry['start'] + delta, end=entry['end'] + delta,
+                checkpoints=[[offset + delta, recdate] for offset, recdate in entry['checkpoints']])
+
+
+def check_uncompressed(path, existing=False):
+    '''
+    Raise ValueError if message file path is compressed, as offsets can only be indexed in an
+    uncompressed message. Compression is found from the file name (see message_io.compression),
+    or from the first bytes of the file if existing is True.
+    '''
+    if (detect_compression(path) if existing else compression(path)) is not None:
+        raise ValueError(f"{path}: offsets can only be indexed in an uncompressed message")
+
+
+def save_index(path, uid, mpoints, every=hums_message.CHECKPOINT):
+    '''Write offset index of message file path (see module doc)'''
+    check_uncompressed(path)
+    index = {'version': INDEX_VERSION, 'uid': uid, 'size': os.path.getsize(path),
+             'every': every, 'mpoints': mpoints}
+    tmp = index_path(path) + '.tmp'
+    with open(tmp, 'w') as fd:
+        json.dump(index, fd, indent=1)
+    os.replace(tmp, index_path(path))
+    return index
+
+
+def load_index(path):
+    '''
+    Read offset index of message file path
+    Raise ValueError if the index is missing or if the message was modified since it was written.
+    '''
+    try:
+        with open(index_path(path)) as fd:
+            index = json.load(fd)
+    except FileNotFoundError:
+        raise ValueError(f"{path}: no offset index {index_path(path)}") from None
+    if index.get('version') != INDEX_VERSION or index['size'] != os.path.getsize(path):
+        raise ValueError(f"{path}: offset index {index_path(path)} is out of date, "
+                         f"rebuild it with build_index")
+    return index
+
+
+def _recdate(mm, offset):
+    '''Recording date in ns of the mPointVal at offset'''
+    match = _RECDATE.match(mm, offset)
+    if match is None:
+        raise ValueError(f"no mPointVal recording date at offset {offset}")
+    date, time = match.group(1).decode(), match.group(2).decode()
+    return int(np.datetime64(f'{date}T{time.strip().rstrip("Z")}', 'ns').astype(np.int64))
+
+
+def build_index(path, every=hums_message.CHECKPOINT):
+    '''
+    Write the offset index of an existing uncompressed message with a single scan of its bytes
+    Inputs:
+        ** path: pathname of message file
+        ** every: mPointVal elements between two checkpoints
+    Output: index (dictionary, see module doc)
+    The column of a mPoint is found from its mPointId in hums_message.MPOINTS (None if absent),
+    last is the recording date of its last mPointVal.
+    '''
+    check_uncompressed(path, existing=True)
+    columns = {mpoint_id: column for mpoint_id, column, _ in hums_message.MPOINTS}
+    entries = []
+    with open(path, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        serial = start = None
+        for match in _MPOINT.finditer(mm):
+            if match.group(1) is not None:
+                serial = unescape(match.group(1).decode('utf-8'))
+            elif match.group(0).startswith(b'<mPoint'):
+                start = match.start()
+                if mm[match.end() - 1:match.end() + 1] == b'/>':      # <mPoint/>
+                    start = None
+            elif start is not None:                                     # </mPoint>
+                end = match.start()
+                id_match = _MPOINT_ID.match(mm, mm.find(b'>', start) + 1)
+                mpoint_id = unescape(id_match.group(1).decode('utf-8')) if id_match else None
+                offsets = np.fromiter((m.start() for m in _MPOINTVAL.finditer(mm, start, end)),
+                                      dtype=np.int64)
+                unit_match = _UNIT.search(mm, offsets[0], end) if len(offsets) else None
+                entries.append({
+                    'serial': serial, 'id': mpoint_id, 'column': columns.get(mpoint_id),
+                    'unit': unescape(unit_match.group(1).decode('utf-8')) if unit_match else None,
+                    'start': start, 'end': end,
+                    'last': _recdate(mm, int(offsets[-1])) if len(offsets) else None,
+                    'count': len(offsets),
+                    'checkpoints': [[offset, _recdate(mm, offset)]
+                                    for offset in offsets[::every].tolist()]})
+                start = None
+    return save_index(path, read_header(path)['uid'], entries, every)
+
+
+def read_window(path, mpoint_id, start=None, end=None, serial=None):
+    '''
+    Values of one mPoint of an indexed message between two recording dates
+    Inputs:
+        ** path: pathname of uncompressed message with its offset index
+        ** mpoint_id: mPointId (e.g. 'CYCLIST HEART RATE')
+        ** start, end: first and last recording date (anything accepted by pandas.Timestamp,
+                       UTC), None for no bound
+        ** serial: serial number of bike (serialPV/serPVId/id), needed for fleet messages
+    Output: measurement point (dictionary: serial, unit, vdtm, timestamp, value,
+            see message_content.read_content)
+    Only the bytes between the checkpoints around start and end are read and parsed.
+    '''
+    index = load_index(path)
+    entries = [entry for entry in index['mpoints'] if entry['id'] == mpoint_id
+               and (serial is None or entry['serial'] == serial)]
+    if not entries:
+        raise ValueError(f"{path}: no mPoint {mpoint_id}" + (f" of bike {serial}" if serial else ""))
+    if len(entries) > 1:
+        raise ValueError(f"{path}: mPoint {mpoint_id} of bikes "
+                         f"{sorted(entry['serial'] for entry in entries)}, give serial")
+    entry = entries[0]
+    first = None if start is None else pd.Timestamp(start).value
+    last = None if end is None else pd.Timestamp(end).value
+    result = {'serial': entry['serial'], 'unit': entry['unit'], 'vdtm': None,
+              'timestamp': np.array([], dtype='datetime64[ns]'),
+              'value': np.array([], dtype=np.float64)}
+    checkpoints = entry['checkpoints']
+    if not checkpoints:
+        return result
+
+    # last checkpoint before start, first checkpoint after end
+    recdates = [recdate for _, recdate in checkpoints]
+    i = 0 if first is None else max(bisect.bisect_left(recdates, first) - 1, 0)
+    j = len(checkpoints) if last is None else bisect.bisect_right(recdates, last)
+    with open(path, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[checkpoints[i][0]:checkpoints[j][0] if j < len(checkpoints) else entry['end']]
+    mpoint = etree.fromstring(b'<mPoint>' + data + b'</mPoint>', _fragment_parser)
+    timestamp, value = mpoint_values(mpoint, len(mpoint))
+    keep = np.ones(len(timestamp), dtype=bool)
+    if first is not None:
+        keep &= timestamp.astype(np.int64) >= first
+    if last is not None:
+        keep &= timestamp.astype(np.int64) <= last
+    result.update(vdtm=mpoint.findtext('mPointVal/vdtm'),
+                  timestamp=timestamp[keep], value=value[keep])
+    return result
+
+
+def append_message(path, trek, serial=None, chunk_size=hums_message.CHUNK_SIZE):
+    '''
+    Append trek points to each mPoint of an existing message, in place
+    Inputs:
+        ** path: pathname of uncompressed message with its offset index
+        ** trek: TrackPoints ordered by time, only trek points later than the last reported one
+                  are appended (found in its time index)
+        ** serial: serial number of bike (serialPV/serPVId/id), needed for fleet messages
+        ** chunk_size: number of trek points formatted at once
+    Output: number of mPointVal elements appended
+    '''
+    index = load_index(path)
+    serials = {entry['serial'] for entry in index['mpoints']}
+    if serial is None and len(serials) > 1:
+        raise ValueError(f"{path}: message reports bikes {sorted(serials)}, give serial")
+    targets = [entry for entry in index['mpoints'] if serial is None or entry['serial'] == serial]
+    if not targets:
+        raise ValueError(f"{path}: no mPoint of bike {serial}")
+
+    # bytes to insert before '</mPoint>' of each target, with their checkpoints
+    inserts = []
+    added = {}                                      # former end of mPoint: checkpoints of insert
+    appended = 0
+    for entry in targets:
+        if entry['column'] is None:
+            raise ValueError(f"{path}: TrackPoints column of mPoint {entry['id']} is unknown")
+        new = trek[trek.time_index.slice(entry['last'], inclusive=False)]
+        added[entry['end']] = []
+        data = b''.join(hums_message.mPointVal_chunks(new, entry['column'], entry['unit'],
+                                                      chunk_size, added[entry['end']],
+                                                      entry['count'], index['every']))
+        count = int(hums_message.valid_values(getattr(new, entry['column'])).sum())
+        appended += count
+        entry['count'] += count
+        if len(new):
+            entry['last'] = int(new.timestamp[-1])
+        if data:
+            inserts.append((entry['end'], data))
+    if inserts:
+        inserts.sort(key=lambda insert: insert[0])
+        first = inserts[0][0]
+        with open(path, 'r+b') as fd:
+            fd.seek(first)
+            tail = fd.read()
+            fd.seek(first)
+            ends = [offset - first for offset, _ in inserts[1:]] + [len(tail)]
+            position = 0
+            for (_, data), end in zip(inserts, ends):
+                fd.write(data)
+                fd.write(tail[position:end])
+                position = end
+
+        # shift offsets of index entries located after each insertion
+        offsets = [offset for offset, _ in inserts]
+        moved = np.cumsum([0] + [len(data) for _, data in inserts]).tolist()
+
+        def shift(position):
+            '''bytes inserted before position'''
+            return moved[bisect.bisect_left(offsets, position)]
+
+        for entry in index['mpoints']:
+            end = entry['end']
+            entry['checkpoints'] = [[offset + shift(offset), recdate]
+                                    for offset, recdate in entry['checkpoints']]
+            entry['checkpoints'] += [[end + shift(end) + offset, recdate]
+                                     for offset, recdate in added.get(end, [])]
+            entry['start'] += shift(entry['start'])
+            entry['end'] += shift(end + 1)
+    save_index(path, index['uid'], index['mpoints'], index['every'])
+    return appended
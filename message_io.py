@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Plain, gzip or zstandard compressed S5000F message files.
+
+Message files are highly repetitive (same recDate, vdtm and unit elements for
+every value) and compress well. open_message() returns a binary file object:
+    - for writing, compression is chosen from the file name: '.xml.gz' (gzip)
+      or '.xml.zst' (zstandard), any other name is written uncompressed; the
+      serializer writes straight into the compressed stream
+    - for reading, compression is detected from the first bytes of the file,
+      so that compressed messages are accepted whatever their name
+'''
+
+import gzip
+import io
+
+from file_utils import list_files
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+MESSAGE_PATTERNS = ('*.xml', '*.xml.gz', '*.xml.zst')
+
+# compression level of written messages
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compression(path):
+    '''Compression of message file path from its name: 'gzip', 'zstd' or None'''
+    name = str(path).lower()
+    if name.endswith('.gz'):
+        return 'gzip'
+    if name.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def detect_compression(path):
+    '''Compression of existing message file path from its first bytes: 'gzip', 'zstd' or None'''
+    with open(path, 'rb') as fd:
+        magic = fd.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def open_message(path, mode='rb', level=None, buffering=-1):
+    '''
+    Open message file path as a binary file object
+    Inputs:
+        ** path: pathname of message file
+        ** mode: 'rb' (compression detected from content) or 'wb' (compression from name)
+        ** level: compression level (default GZIP_LEVEL or ZSTD_LEVEL)
+        ** buffering: buffer size of underlying file (plain and zstandard files)
+    '''
+    if mode not in ('rb', 'wb'):
+        raise ValueError(f"mode must be 'rb' or 'wb', not {mode!r}")
+    kind = detect_compression(path) if mode == 'rb' else compression(path)
+    if kind is None:
+        return open(path, mode, buffering=buffering)
+    if kind == 'gzip':
+        # mtime=0: same message gives same compressed bytes
+        return gzip.GzipFile(path, mode, compresslevel=GZIP_LEVEL if level is None else level,
+                             mtime=0)
+    import zstandard                    # pip install zstandard
+    fd = open(path, mode, buffering=buffering)
+    if mode == 'rb':                    # buffered, for readline and iteration
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fd, closefd=True))
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL if level is None else level).stream_writer(
+        fd, closefd=True)
+
+
+def list_message_files(inputs):
+    '''
+    Expand input folders and glob patterns into a sorted list of message files
+    Folders are searched recursively for MESSAGE_PATTERNS files.
+    '''
+    return list_files(inputs, MESSAGE_PATTERNS)
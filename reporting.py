@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Reduction of the measurement values reported in S5000F messages.
+
+Deadband (change-only) reporting: a value is reported only when it differs from
+the last reported value by more than a tolerance, and at least once every
+heartbeat interval. Values which are not reported are set to missing (NaN or
+trackpoints.MISSING_INT) in a copy of the trek points: message generation
+(hums_message, hums_split) does not report missing values, so all message
+writers produce the reduced messages without change.
+
+Track simplification: GPS positions are reduced with the Douglas-Peucker
+algorithm (distance tolerance in metres). Kept trek points are the same for
+latitude, longitude and elevation, so that their recording dates match.
+'''
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from trackpoints import TrackPoints, missing_value
+
+# mean radius of Earth in metres
+EARTH_RADIUS = 6371000.0
+
+# trek points per initial segment of douglas_peucker
+BLOCK = 256
+
+# changes within the deadband scanned in Python before searching with numpy (deadband_mask)
+SEARCH_BLOCK = 32
+
+# deadband settings of scalar measurement points: column: (tolerance, heartbeat)
+DEADBAND = {'heart_rate': (0, '60s'),
+            'cadence': (0, '60s')}
+
+
+def next_out(values, start, ref, tolerance):
+    '''Index of first value from start differing from ref by more than tolerance (None if none)'''
+    size = 4 * SEARCH_BLOCK
+    while start < len(values):
+        out = np.flatnonzero(np.abs(values[start:start + size] - ref) > tolerance)
+        if len(out):
+            return start + int(out[0])
+        start, size = start + size, 2 * size
+    return None
+
+
+def deadband_mask(values, timestamp, tolerance=0, heartbeat=None):
+    '''
+    Mask of values reported in deadband mode
+    Inputs:
+        ** values: array of measurement values, missing values are never reported
+        ** timestamp: array of timestamps in ns, sorted
+        ** tolerance: a value is reported if it differs from the last reported value by more
+                      than tolerance (0: every change is reported)
+        ** heartbeat: maximum interval between reported values (pandas timedelta string,
+                      timedelta or nanoseconds), None for no heartbeat
+    Output: boolean array
+    A heartbeat report repeats the current value and does not move the deadband reference.
+    '''
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.floating):
+        valid = np.flatnonzero(~np.isnan(values))
+    else:
+        valid = np.flatnonzero(values >= 0)
+    mask = np.zeros(len(values), dtype=bool)
+    if len(valid) == 0:
+        return mask
+    v = values[valid].astype(np.float64)
+
+    # every change of value (first value included)
+    report = np.empty(len(v), dtype=bool)
+    report[0] = True
+    np.not_equal(v[1:], v[:-1], out=report[1:])
+    if tolerance > 0:
+        # the reference only moves when a value is reported, so each reported change depends
+        # on the previous one and changes are scanned in order. After SEARCH_BLOCK changes
+        # within the deadband, the next change out of it is searched with numpy in blocks of
+        # doubling size and the scan skips to it: Python iterations are bounded by
+        # SEARCH_BLOCK plus the log of the changes skipped per reported value
+        changes = np.flatnonzero(report)
+        cv = v[changes]
+        values_list = cv.tolist()
+        kept = [0]
+        ref = values_list[0]
+        inside = 0
+        scan = enumerate(values_list)
+        next(scan)
+        for k, x in scan:
+            if abs(x - ref) > tolerance:
+                kept.append(k)
+                ref = x
+                inside = 0
+            elif inside < SEARCH_BLOCK:
+                inside += 1
+            else:
+                j = next_out(cv, k + 1, ref, tolerance)
+                if j is None:
+                    break
+                kept.append(j)
+                ref = values_list[j]
+                inside = 0
+                next(itertools.islice(scan, j - k, j - k), None)     # resume after j
+        report[:] = False
+        report[changes[kept]] = True
+
+    if heartbeat is not None:
+        # heartbeat grid starts at each reported value
+        t = np.asarray(timestamp)[valid]
+        period = pd.to_timedelta(heartbeat).value
+        last = np.flatnonzero(report)[np.cumsum(report) - 1]
+        beat = (t - t[last]) // period
+        report[1:] |= (beat[1:] != beat[:-1]) & (last[1:] == last[:-1])
+
+    mask[valid[report]] = True
+    return mask
+
+
+def deadband(trek, settings=DEADBAND):
+    '''
+    Apply deadband reporting to trek points
+    Inputs:
+        ** trek: TrackPoints
+        ** settings: dictionary column: (tolerance, heartbeat), see deadband_mask
+    Output: TrackPoints, columns of settings are copies where values not reported are missing,
+            other columns are shared with trek
+    '''
+    columns = {name: getattr(trek, name) for name in trek.columns}
+    for name, (tolerance, heartbeat) in settings.items():
+        values = columns[name]
+        reported = deadband_mask(values, trek.timestamp, tolerance, heartbeat)
+        columns[name] = np.where(reported, values, missing_value(values.dtype)).astype(values.dtype)
+    return TrackPoints(**columns)
+
+
+def local_xy(latitude, longitude):
+    '''Equirectangular projection (metres) of positions in degrees, centred on their mean latitude'''
+    lat = np.radians(latitude)
+    x = EARTH_RADIUS * np.cos(lat.mean()) * np.radians(longitude)
+    return x, EARTH_RADIUS * lat
+
+
+def douglas_peucker(x, y, tolerance, block=BLOCK):
+    '''
+    Douglas-Peucker simplification of the polyline (x, y)
+    All segments of a recursion level are processed at once: distances of their inner
+    points to the segment are computed in one array, the farthest point of each segment
+    further than tolerance splits it in two.
+    Output: boolean mask of kept points
+    '''
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    bounds = np.unique(np.append(np.arange(0, n, block), n - 1))
+    keep[bounds] = True
+    tolerance2 = float(tolerance) ** 2
+    starts, ends = bounds[:-1], bounds[1:]
+    while True:
+        inner = ends - starts - 1
+        active = inner > 0
+        starts, ends, inner = starts[active], ends[active], inner[active]
+        if len(starts) == 0:
+            return keep
+        # positions of inner points of all segments
+        offsets = np.cumsum(inner) - inner
+        segment = np.repeat(np.arange(len(starts)), inner)
+        points = np.arange(inner.sum()) - offsets[segment] + starts[segment] + 1
+
+        # squared distance of each inner point to its segment
+        x0, y0 = x[starts][segment], y[starts][segment]
+        dx, dy = x[ends][segment] - x0, y[ends][segment] - y0
+        px, py = x[points] - x0, y[points] - y0
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            u = np.clip((px * dx + py * dy) / length2, 0, 1)
+        u[length2 == 0] = 0
+        ex, ey = px - u * dx, py - u * dy
+        distance2 = ex * ex + ey * ey
+
+        farthest = np.maximum.reduceat(distance2, offsets)
+        split = farthest > tolerance2
+        if not split.any():
+            return keep
+        # first point of each split segment reaching its maximum distance
+        candidates = np.flatnonzero((distance2 == farthest[segment]) & split[segment])
+        owner = segment[candidates]                 # sorted
+        first = np.flatnonzero(np.diff(owner, prepend=-1))
+        middle = points[candidates[first]]
+        keep[middle] = True
+        starts = np.concatenate((starts[split], middle))
+        ends = np.concatenate((middle, ends[split]))
+
+
+def simplify_mask(latitude, longitude, tolerance):
+    '''
+    Mask of trek points kept by track simplification
+    Inputs:
+        ** latitude, longitude: arrays of positions in degrees, missing positions (NaN) are not kept
+        ** tolerance: maximum distance in metres between the track and its simplification
+    Output: boolean array
+    '''
+    valid = np.flatnonzero(~np.isnan(latitude) & ~np.isnan(longitude))
+    mask = np.zeros(len(latitude), dtype=bool)
+    if len(valid):
+        x, y = local_xy(latitude[valid], longitude[valid])
+        mask[valid[douglas_peucker(x, y, tolerance)]] = True
+    return mask
+
+
+def simplify(trek, tolerance=5.0, columns=('latitude', 'longitude', 'elevation')):
+    '''
+    Simplify the GPS track of trek points
+    Inputs:
+        ** trek: TrackPoints
+        ** tolerance: maximum distance in metres between the track and its simplification
+        ** columns: columns set missing at trek points which are not kept
+    Output: TrackPoints, columns are copies where values of removed trek points are missing,
+            other columns are shared with trek
+    '''
+    kept = simplify_mask(trek.latitude, trek.longitude, tolerance)
+    result = {name: getattr(trek, name) for name in trek.columns}
+    for name in columns:
+        values = result[name]
+        result[name] = np.where(kept, values, missing_value(values.dtype)).astype(values.dtype)
+    return TrackPoints(**result)
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+'''Tests of bulk_ingest on a folder of GPX, FIT and non activity files'''
+
+import os
+import shutil
+
+import pyarrow.parquet as pq
+
+import bulk_ingest
+import gpx_reader
+from fit_reader import write_fit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTIVITY = os.path.join(ROOT, 'activity_4588550232.xml')
+MESSAGE = os.path.join(ROOT, 'msg886055866860521784.xml')
+
+
+def test_activity_ids():
+    ids = bulk_ingest.activity_ids(['a/x.gpx', 'a/x.fit', 'b/x.gpx', 'a/activity_12.xml', 'y.gpx'])
+    assert ids == {'a/x.gpx': 'x_gpx', 'a/x.fit': 'x_fit', 'b/x.gpx': 'x_gpx_2',
+                   'a/activity_12.xml': '12', 'y.gpx': 'y'}
+
+
+def test_ingest(tmp_path):
+    folder = tmp_path / 'activities'
+    folder.mkdir()
+    shutil.copy(ACTIVITY, folder / 'ride.gpx')
+    write_fit(str(folder / 'ride.fit'), gpx_reader.read_trackpoints(ACTIVITY))
+    shutil.copy(MESSAGE, folder / 'message.xml')
+    manifest = bulk_ingest.ingest([str(folder)], str(tmp_path / 'dataset'), workers=1)
+
+    entries = {os.path.basename(entry['file']): entry for entry in manifest['activities']}
+    assert manifest['errors'] == 0 and manifest['skipped'] == 1
+    assert entries['message.xml']['status'] == 'SKIPPED'
+    assert entries['ride.gpx']['activity_id'] == 'ride_gpx'
+    assert entries['ride.fit']['activity_id'] == 'ride_fit'
+    partitions = entries['ride.gpx']['partitions'] + entries['ride.fit']['partitions']
+    assert len(set(partitions)) == len(partitions) == 2
+    table = pq.read_table(partitions[0])
+    assert table.num_rows == entries['ride.gpx']['points']
+    assert table.column('HeartRate').null_count == 0
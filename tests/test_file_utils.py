@@ -0,0 +1,38 @@
+# coding: utf-8
+
+'''Tests of input file listing and content hash'''
+
+import pathlib
+
+from file_utils import file_hash, list_files
+
+
+def touch(path, content=b''):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_list_files(tmp_path):
+    gpx = touch(tmp_path / 'a.gpx')
+    fit = touch(tmp_path / 'sub' / 'deep' / 'b.fit')
+    touch(tmp_path / 'sub' / 'c.txt')
+    other = touch(tmp_path / 'other' / 'd.gpx')
+
+    assert list_files(str(tmp_path / 'sub'), ('*.gpx', '*.fit')) == [fit]
+    assert list_files(tmp_path, ('*.gpx',)) == sorted([gpx, other])
+    assert list_files(tmp_path, ('*.gpx', '*.fit')) == sorted([gpx, fit, other])
+    # glob patterns, folders and duplicates mixed
+    assert list_files([str(tmp_path / '**' / '*.fit'), pathlib.Path(tmp_path / 'other'), gpx, gpx],
+                      ('*.gpx',)) == sorted([gpx, fit, other])
+    assert list_files(str(tmp_path / 'missing'), ('*.gpx',)) == []
+
+
+def test_file_hash(tmp_path):
+    content = bytes(range(256)) * 1000
+    path = touch(tmp_path / 'a.bin', content)
+    digest = file_hash(path)
+    assert len(digest) == 40
+    assert file_hash(path, block_size=1000) == digest
+    assert file_hash(touch(tmp_path / 'copy.bin', content)) == digest
+    assert file_hash(touch(tmp_path / 'b.bin', content[:-1] + b'x')) != digest
@@ -0,0 +1,107 @@
+# coding: utf-8
+
+'''Tests of fit_reader with FIT files written by write_fit and hand-built byte strings'''
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+import gpx_reader
+from fit_reader import FIT_EPOCH, RECORD, SEMICIRCLE, FitError, fit_crc, read_fit, write_fit
+from trackpoints import MISSING_INT, TrackPoints
+
+ACTIVITY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'activity_4588550232.xml')
+
+
+def fit_file(path, data):
+    '''Write FIT file path holding data messages data (header and CRC added)'''
+    header = bytes([14, 0x20]) + struct.pack('<HI', 2132, len(data)) + b'.FIT'
+    header += struct.pack('<H', fit_crc(header))
+    content = header + data
+    with open(path, 'wb') as fd:
+        fd.write(content + struct.pack('<H', fit_crc(content)))
+    return path
+
+
+def record_definition(local=0, developer=b''):
+    '''Definition message of records (timestamp, heart_rate), developer fields appended'''
+    header = 0x40 | local | (0x20 if developer else 0)
+    content = bytes([0, 0]) + struct.pack('<H', RECORD) + bytes([2, 253, 4, 0x86, 3, 1, 0x02])
+    if developer:
+        content += developer
+    return bytes([header]) + content
+
+
+def test_gpx_fit_round_trip(tmp_path):
+    gpx = gpx_reader.read_trackpoints(ACTIVITY)
+    path = str(tmp_path / 'activity.fit')
+    write_fit(path, gpx)
+    fit = read_fit(path, check_crc=True)
+    assert len(fit) == len(gpx)
+    np.testing.assert_array_equal(fit.timestamp, gpx.timestamp // 10 ** 9 * 10 ** 9)
+    np.testing.assert_allclose(fit.latitude, gpx.latitude, atol=SEMICIRCLE)
+    np.testing.assert_allclose(fit.longitude, gpx.longitude, atol=SEMICIRCLE)
+    np.testing.assert_allclose(fit.elevation, gpx.elevation, atol=0.2)
+    np.testing.assert_array_equal(fit.heart_rate, gpx.heart_rate)
+    np.testing.assert_array_equal(fit.cadence, gpx.cadence)
+
+
+def test_invalid_values(tmp_path):
+    timestamp = (FIT_EPOCH + 1000 + np.arange(3)) * 10 ** 9
+    trek = TrackPoints(timestamp=timestamp.astype(np.int64),
+                       latitude=np.array([43.5, np.nan, 43.6]),
+                       longitude=np.array([5.4, np.nan, 5.5]),
+                       elevation=np.array([np.nan, 200.0, 210.0], dtype=np.float32),
+                       heart_rate=np.array([MISSING_INT, 120, 121], dtype=np.int16),
+                       cadence=np.array([80, MISSING_INT, 82], dtype=np.int16))
+    path = str(tmp_path / 'invalid.fit')
+    write_fit(path, trek)
+    fit = read_fit(path)
+    np.testing.assert_array_equal(np.isnan(fit.latitude), [False, True, False])
+    np.testing.assert_array_equal(np.isnan(fit.longitude), [False, True, False])
+    np.testing.assert_array_equal(np.isnan(fit.elevation), [True, False, False])
+    np.testing.assert_array_equal(fit.heart_rate, [MISSING_INT, 120, 121])
+    np.testing.assert_array_equal(fit.cadence, [80, MISSING_INT, 82])
+
+
+def test_compressed_timestamps(tmp_path):
+    # full timestamp 1000 (1000 & 0x1F = 8), then compressed offsets 10, 31 and 2 (rollover)
+    data = record_definition()
+    data += bytes([0x00]) + struct.pack('<I', 1000) + bytes([100])
+    # definition of local type 1 (heart_rate only), used by the compressed timestamp headers
+    data += bytes([0x40 | 1]) + bytes([0, 0]) + struct.pack('<H', RECORD) + bytes([1, 3, 1, 0x02])
+    for offset, heart_rate in ((10, 101), (31, 102), (2, 103)):
+        data += bytes([0x80 | (1 << 5) | offset, heart_rate])
+    fit = read_fit(fit_file(str(tmp_path / 'compressed.fit'), data), check_crc=True)
+    expected = np.array([1000, 1002, 1023, 1026]) + FIT_EPOCH
+    np.testing.assert_array_equal(fit.timestamp // 10 ** 9, expected)
+    np.testing.assert_array_equal(fit.heart_rate, [100, 101, 102, 103])
+
+
+def test_developer_fields(tmp_path):
+    # one developer field: number 0, size 4, developer data index 3
+    data = record_definition(developer=bytes([1, 0, 4, 3]))
+    for i in range(5):
+        data += bytes([0x00]) + struct.pack('<I', 1000 + i) + bytes([100 + i]) + b'\xAA' * 4
+    fit = read_fit(fit_file(str(tmp_path / 'developer.fit'), data), check_crc=True)
+    assert len(fit) == 5
+    np.testing.assert_array_equal(fit.timestamp // 10 ** 9, 1000 + FIT_EPOCH + np.arange(5))
+    np.testing.assert_array_equal(fit.heart_rate, 100 + np.arange(5))
+
+
+def test_undefined_local_type(tmp_path):
+    data = record_definition() + bytes([0x00]) + struct.pack('<I', 1000) + bytes([100])
+    with pytest.raises(FitError):
+        read_fit(fit_file(str(tmp_path / 'data.fit'), data + bytes([0x02, 0])))
+    with pytest.raises(FitError):
+        read_fit(fit_file(str(tmp_path / 'compressed.fit'), data + bytes([0x80 | (2 << 5) | 3, 0])))
+
+
+def test_not_a_fit_file(tmp_path):
+    path = tmp_path / 'text.fit'
+    path.write_bytes(b'not a FIT file at all')
+    with pytest.raises(FitError):
+        read_fit(str(path))
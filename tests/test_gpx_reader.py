@@ -0,0 +1,32 @@
+# coding: utf-8
+
+'''Tests of the parallel GPX reader'''
+
+import numpy as np
+
+import gpx_reader
+from test_fit_reader import ACTIVITY
+
+
+def test_split_ranges():
+    root_tag, ranges = gpx_reader.split_ranges(ACTIVITY, 5)
+    assert root_tag.startswith(b'<gpx')
+    with open(ACTIVITY, 'rb') as fd:
+        data = fd.read()
+    assert len(ranges) == 5
+    assert all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+    counts = []
+    for start, end in ranges:
+        part = data[start:end]
+        assert part.lstrip().startswith(b'<trkpt') and part.endswith(b'</trkpt>')
+        counts.append(part.count(b'<trkpt'))
+    assert sum(counts) == data.count(b'<trkpt')
+
+
+def test_parallel_equals_serial():
+    serial = gpx_reader.read_trackpoints(ACTIVITY)
+    parallel = gpx_reader.read_trackpoints_parallel(ACTIVITY, workers=3, min_range=1)
+    assert parallel.columns == serial.columns
+    for name in serial.columns:
+        np.testing.assert_array_equal(getattr(parallel, name), getattr(serial, name))
+    assert len(parallel.time_index) == len(serial)
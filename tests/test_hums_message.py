@@ -0,0 +1,84 @@
+# coding: utf-8
+
+'''Tests of the content of UC50902 messages created by hums_message'''
+
+import re
+
+import numpy as np
+import pytest
+
+import gpx_reader
+import hums_message
+from message_content import read_content
+from message_header import header_fields, read_header
+from test_fit_reader import ACTIVITY
+from trackpoints import MISSING_INT, TrackPoints
+
+HEADER = {'msg_date': '2020-04-16', 'msg_time': '16:13:37.0Z', 'msg_type': 'UC50902',
+          'msg_id': 'Bicycle trek on 2020-02-25', 'msg_status': 'F'}
+TRAILER = {'msg_project': 'ASD/AIA S5000F Bicycle Example',
+           'msg_sender': 'Guillaume OLLIVIER (g.ollivier@a2l.net)',
+           'msg_receiver': 'Bernard RAUST (bernard.raust@edxea.com)',
+           'msg_remarks': 'Feedback about bicycle trek done on 2020-02-25',
+           'msg_classif': 'NUC'}
+
+
+def sample_trek():
+    '''Four trek points, some of their values missing'''
+    timestamp = np.datetime64('2020-02-25T06:27:35', 'ns').astype(np.int64) + np.arange(4) * 10 ** 9
+    return TrackPoints(timestamp=timestamp,
+                       latitude=np.array([43.5, np.nan, 43.6, 43.7]),
+                       longitude=np.array([5.4, np.nan, 5.5, 5.6]),
+                       elevation=np.array([348.6, 349.0, np.nan, 350.2], dtype=np.float32),
+                       heart_rate=np.array([114, MISSING_INT, MISSING_INT, 120], dtype=np.int16),
+                       cadence=np.array([66, 67, 68, 69], dtype=np.int16))
+
+
+def test_trailer_values():
+    root = hums_message.build_message(sample_trek(), HEADER, TRAILER).getroot()
+    fields = header_fields(root)
+    assert fields['context'] == TRAILER['msg_project']
+    assert fields['sender'] == TRAILER['msg_sender']
+    assert fields['receiver'] == TRAILER['msg_receiver']
+    assert fields['classif'] == TRAILER['msg_classif']
+    assert root.findtext('rmks/rmk/text/descr') == TRAILER['msg_remarks']
+
+
+def test_missing_values_not_reported(tmp_path):
+    trek = sample_trek()
+    root = hums_message.build_message(trek, HEADER, TRAILER).getroot()
+    counts = {mpoint.findtext('mPointId/id'): len(mpoint.findall('mPointVal'))
+              for mpoint in root.iter('mPoint')}
+    assert counts == {'BIKE GPS LATITUDE': 3, 'BIKE GPS LONGITUDE': 3, 'BIKE GPS ELEVATION': 3,
+                      'CYCLIST HEART RATE': 2, 'BIKE CADENCE': 4}
+    values = root.xpath("//mPoint[mPointId/id='CYCLIST HEART RATE']/mPointVal/value/text()")
+    assert values == ['114', '120']
+
+    # streamed and byte template messages are the same as the lxml message
+    for name, write in (('stream.xml', hums_message.stream_message),
+                        ('fast.xml', hums_message.fast_message)):
+        path = str(tmp_path / name)
+        write(trek, path, HEADER, TRAILER)
+        hums_message.verify_message(path, trek, HEADER, TRAILER)
+        assert read_header(path)['sender'] == TRAILER['msg_sender']
+
+
+def test_index_of_compressed_message(tmp_path):
+    path = tmp_path / 'message.xml.gz'
+    with pytest.raises(ValueError):
+        hums_message.fast_message(sample_trek(), str(path), HEADER, TRAILER, index=True)
+    assert not path.exists()
+
+
+def test_values_round_trip(tmp_path):
+    trek = gpx_reader.read_trackpoints(ACTIVITY)
+    path = str(tmp_path / 'message.xml')
+    hums_message.fast_message(trek, path, HEADER, TRAILER)
+    content = read_content(path)
+    for mpoint_id, column, _ in hums_message.MPOINTS:
+        values = getattr(trek, column)
+        np.testing.assert_array_equal(content[mpoint_id]['value'].astype(values.dtype), values)
+    # GPX text is the exact decimal form of the float64 stored in the message
+    with open(ACTIVITY) as fd:
+        latitudes = [float(text) for text in re.findall(r'<trkpt lat="([^"]+)"', fd.read())]
+    np.testing.assert_array_equal(content['BIKE GPS LATITUDE']['value'], latitudes)
@@ -0,0 +1,71 @@
+# coding: utf-8
+
+'''Tests of the split of a trek into several UC50902 messages'''
+
+import os
+
+import pandas as pd
+
+import hums_message
+import hums_split
+from test_hums_message import HEADER, TRAILER
+from test_message_index import sample_trek
+
+
+def read_bytes(path):
+    with open(path, 'rb') as fd:
+        return fd.read()
+
+
+def check_parts(trek, manifest):
+    '''Parts cover the trek in time order and are linked by their uids'''
+    messages = manifest['messages']
+    assert sum(entry['points'] for entry in messages) == len(trek)
+    assert [entry['part'] for entry in messages] == list(range(1, len(messages) + 1))
+    for before, after in zip(messages[:-1], messages[1:]):
+        assert before['next'] == after['uid'] and after['previous'] == before['uid']
+        assert pd.Timestamp(before['end']) < pd.Timestamp(after['start'])
+    assert len({entry['uid'] for entry in messages}) == len(messages)
+
+
+def test_max_values_and_bytes(tmp_path):
+    trek = sample_trek()
+    manifest = hums_split.split_messages(trek, str(tmp_path / 'values'), HEADER, TRAILER,
+                                         max_values=2000, workers=1)
+    check_parts(trek, manifest)
+    assert manifest['parts'] > 1
+    for entry in manifest['messages']:
+        assert read_bytes(entry['file']).count(b'<mPointVal>') <= 2000
+
+    manifest = hums_split.split_messages(trek, str(tmp_path / 'bytes'), HEADER, TRAILER,
+                                         max_bytes=200000, workers=1)
+    check_parts(trek, manifest)
+    assert manifest['parts'] > 1
+    assert all(os.path.getsize(entry['file']) <= 200000 for entry in manifest['messages'])
+
+
+def test_window(tmp_path):
+    trek = sample_trek()
+    manifest = hums_split.split_messages(trek, str(tmp_path), HEADER, TRAILER, window='10min',
+                                         workers=1)
+    check_parts(trek, manifest)
+    ride_start = pd.Timestamp(trek.timestamp[0])
+    for entry in manifest['messages']:
+        windows = {(pd.Timestamp(entry[key]) - ride_start) // pd.Timedelta('10min')
+                   for key in ('start', 'end')}
+        assert len(windows) == 1
+    assert manifest['parts'] == (trek.timestamp[-1] - trek.timestamp[0]) // (600 * 10 ** 9) + 1
+
+
+def test_single_part(tmp_path):
+    trek = sample_trek()
+    manifest = hums_split.split_messages(trek, str(tmp_path), HEADER, TRAILER, max_values=10 ** 6,
+                                         workers=1)
+    assert manifest['parts'] == 1
+    path = str(tmp_path / 'whole.xml')
+    uid = hums_message.fast_message(trek, path, HEADER, TRAILER)
+    assert manifest['messages'][0]['uid'] == uid
+    assert read_bytes(manifest['messages'][0]['file']) == read_bytes(path)
+    assert hums_split.split_bounds(trek[:0]) == [(0, 0)]
+    # a part holds at least one trek point
+    assert len(hums_split.split_bounds(trek, max_values=1)) == len(trek)
@@ -0,0 +1,79 @@
+# coding: utf-8
+
+'''Tests of the catalog of message headers'''
+
+import os
+
+import hums_message
+import message_catalog
+from message_catalog import MessageCatalog
+from test_hums_message import HEADER, TRAILER, sample_trek
+
+
+def write_messages(folder):
+    '''Three messages of two senders, one of them compressed, and a file which is not a message'''
+    trek = sample_trek()
+    paths = []
+    for i, (date, sender, name) in enumerate([('2020-04-08', 'A', 'one.xml'),
+                                              ('2020-04-16', 'B', 'sub/two.xml'),
+                                              ('2020-05-02', 'A', 'three.xml.gz')]):
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        hums_message.fast_message(trek, path, dict(HEADER, msg_date=date, msg_id=f"trek {i}"),
+                                  dict(TRAILER, msg_sender=sender))
+        paths.append(path)
+    with open(os.path.join(folder, 'broken.xml'), 'w') as fd:
+        fd.write('<not a message')
+    return paths
+
+
+def test_incremental_update(tmp_path, monkeypatch):
+    folder = str(tmp_path / 'messages')
+    one, two, three = write_messages(folder)
+    read = []
+    read_header = message_catalog.read_header
+    monkeypatch.setattr(message_catalog, 'read_header',
+                        lambda path: read.append(os.path.basename(path)) or read_header(path))
+
+    with MessageCatalog(str(tmp_path / 'catalog.sqlite')) as catalog:
+        assert catalog.update(folder) == {'added': 4, 'updated': 0, 'unchanged': 0,
+                                          'removed': 0, 'errors': 1}
+        assert len(catalog) == 4 and one in catalog
+        read.clear()
+
+        # re-scan only reads changed files
+        assert catalog.update(folder)['unchanged'] == 4
+        os.utime(two, ns=(0, 0))                                # touched, same content
+        hums_message.fast_message(sample_trek(), one, dict(HEADER, msg_date='2020-04-08',
+                                  msg_id='trek 0 bis'), dict(TRAILER, msg_sender='A'))
+        counts = catalog.update(folder)
+        assert counts == {'added': 0, 'updated': 1, 'unchanged': 3, 'removed': 0, 'errors': 0}
+        assert read == ['one.xml']
+        assert catalog.query(id='trek 0 bis')[0]['path'] == os.path.abspath(one)
+
+        # prune removes deleted files of the scanned folders only
+        os.remove(three)
+        assert catalog.update(os.path.join(folder, 'sub'))['removed'] == 0
+        assert catalog.update(folder, prune=False)['removed'] == 0
+        assert catalog.update(folder)['removed'] == 1
+        assert three not in catalog and len(catalog) == 3
+
+
+def test_query(tmp_path):
+    folder = str(tmp_path / 'messages')
+    one, two, three = write_messages(folder)
+    with MessageCatalog(str(tmp_path / 'catalog.sqlite')) as catalog:
+        catalog.update(folder)
+
+    # catalog read back from its database
+    with MessageCatalog(str(tmp_path / 'catalog.sqlite')) as catalog:
+        paths = [os.path.abspath(path) for path in (one, two, three)]
+        assert [row['path'] for row in catalog.query()] == paths
+        assert [row['path'] for row in catalog.query(sender='A')] == [paths[0], paths[2]]
+        assert [row['path'] for row in catalog.query(sender='A', since='2020-04-09')] == paths[2:]
+        assert [row['path'] for row in catalog.query(until='2020-04-16')] == paths[:2]
+        row = catalog.query(id='trek 1')[0]
+        assert row['uid'] == 'msg' + hums_message.pos_hash('trek 1') and row['type'] == 'UC50902'
+        errors = [row for row in catalog.query(errors=True) if row['error'] is not None]
+        assert [os.path.basename(row['path']) for row in errors] == ['broken.xml']
+        assert list(catalog.dataframe(sender='B').path) == [paths[1]]
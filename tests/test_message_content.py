@@ -0,0 +1,88 @@
+# coding: utf-8
+
+'''Tests of the streaming reader of message content'''
+
+import numpy as np
+import pytest
+
+import gpx_reader
+import hums_fleet
+import hums_message
+from hums_message import MPOINTS, SERIAL_PV
+from message_content import content_dataframe, read_content
+from test_fit_reader import ACTIVITY
+from test_hums_message import HEADER, TRAILER
+from test_message_index import sample_trek
+from trackpoints import MISSING_INT
+
+
+def expected_content(trek):
+    '''Timestamps and values of each measurement point of trek, missing values left out'''
+    content = {}
+    for mpoint_id, column, unit in MPOINTS:
+        values = getattr(trek, column)
+        valid = values != MISSING_INT if values.dtype.kind == 'i' else ~np.isnan(values)
+        content[mpoint_id] = (trek.timestamp[valid].astype('datetime64[ns]'), values[valid])
+    return content
+
+
+@pytest.fixture(scope='module')
+def message(tmp_path_factory):
+    trek = sample_trek()
+    path = str(tmp_path_factory.mktemp('content') / 'message.xml')
+    hums_message.fast_message(trek, path, HEADER, TRAILER)
+    return trek, path
+
+
+@pytest.mark.parametrize('batch', [4096, 100, 1])
+def test_read_content(message, batch):
+    trek, path = message
+    content = read_content(path, batch=batch)
+    assert list(content) == [mpoint_id for mpoint_id, _, _ in MPOINTS]
+    for mpoint_id, column, unit in MPOINTS:
+        point = content[mpoint_id]
+        timestamp, values = expected_content(trek)[mpoint_id]
+        assert point['serial'] == SERIAL_PV['ser_pv_id'] and point['unit'] == unit
+        assert point['timestamp'].dtype == np.dtype('datetime64[ns]')
+        assert (point['timestamp'] == timestamp).all()
+        # values read as float64 are the values of the trek in their own type
+        assert (point['value'].astype(values.dtype) == values).all()
+
+
+def test_selected_mpoints(message):
+    trek, path = message
+    content = read_content(path, mpoints=['BIKE CADENCE', 'unknown'], batch=10)
+    assert list(content) == ['BIKE CADENCE']
+    assert (content['BIKE CADENCE']['value'] == expected_content(trek)['BIKE CADENCE'][1]).all()
+    assert read_content(path, mpoints=[]) == {}
+
+
+def test_content_dataframe(message):
+    trek, path = message
+    frame = read_content(path, dataframe=True)
+    expected = expected_content(trek)
+    assert len(frame) == sum(len(values) for _, values in expected.values())
+    assert list(frame.columns) == ['serial', 'mpoint', 'timestamp', 'value', 'unit', 'vdtm']
+    assert frame['mpoint'].dtype == 'category'
+    heart_rate = frame[frame.mpoint == 'CYCLIST HEART RATE']
+    assert (heart_rate.value.to_numpy() == expected['CYCLIST HEART RATE'][1]).all()
+    assert content_dataframe({}).empty
+
+
+def test_fleet_content(tmp_path):
+    path = str(tmp_path / 'fleet.xml')
+    report = hums_fleet.fleet_message({'46': ACTIVITY, '47': ACTIVITY}, path, HEADER, TRAILER,
+                                      workers=1)
+    assert report['errors'] == 0
+    with pytest.raises(ValueError, match='several bikes'):
+        read_content(path)
+    single = str(tmp_path / 'single.xml')
+    hums_message.fast_message(gpx_reader.read_trackpoints(ACTIVITY), single, HEADER, TRAILER)
+    expected = read_content(single)
+    for serial in ('46', '47'):
+        content = read_content(path, serial=serial, batch=50)
+        assert list(content) == list(expected)
+        for mpoint_id, point in content.items():
+            assert point['serial'] == serial
+            assert (point['timestamp'] == expected[mpoint_id]['timestamp']).all()
+            assert (point['value'] == expected[mpoint_id]['value']).all()
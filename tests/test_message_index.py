@@ -0,0 +1,103 @@
+# coding: utf-8
+
+'''Tests of message_index: offset index, windowed reads and in place appends'''
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import gpx_reader
+import hums_message
+import message_index
+from test_fit_reader import ACTIVITY
+from test_hums_message import HEADER, TRAILER
+from trackpoints import MISSING_INT
+
+
+def sample_trek():
+    '''Sample ride with missing values (hidden positions, heart rate and cadence sensor drops)'''
+    trek = gpx_reader.read_trackpoints(ACTIVITY)
+    trek.latitude[300:420] = np.nan
+    trek.longitude[300:420] = np.nan
+    trek.elevation[1000:1010] = np.nan
+    trek.heart_rate[500:700] = MISSING_INT
+    trek.cadence[::7] = MISSING_INT
+    trek.heart_rate[-1] = MISSING_INT                   # last trek point partly missing
+    return trek
+
+
+def read_index(path):
+    with open(message_index.index_path(path)) as fd:
+        return json.load(fd)
+
+
+def test_append_in_pieces(tmp_path):
+    trek = sample_trek()
+    full = str(tmp_path / 'full.xml')
+    hums_message.fast_message(trek, full, HEADER, TRAILER, index=True)
+
+    pieces = str(tmp_path / 'pieces.xml')
+    bounds = [0, 700, 701, 1500, 2600, len(trek)]
+    hums_message.fast_message(trek[:bounds[1]], pieces, HEADER, TRAILER, index=True)
+    before = sum(entry['count'] for entry in read_index(pieces)['mpoints'])
+    appended = 0
+    for start, end in zip(bounds[1:-1], bounds[2:]):
+        appended += message_index.append_message(pieces, trek[start:end])
+    assert message_index.append_message(pieces, trek) == 0        # nothing later than last point
+
+    with open(full, 'rb') as a, open(pieces, 'rb') as b:
+        assert a.read() == b.read()
+    assert read_index(full) == read_index(pieces)
+    assert before + appended == sum(entry['count'] for entry in read_index(full)['mpoints'])
+
+
+
+def indexed_message(tmp_path, trek):
+    path = str(tmp_path / 'message.xml')
+    hums_message.fast_message(trek, path, HEADER, TRAILER, index=True)
+    return path
+
+
+def test_build_index(tmp_path):
+    trek = sample_trek()
+    trek.heart_rate[-1] = 120                   # build_index takes last from the last mPointVal
+    path = indexed_message(tmp_path, trek)
+    written = read_index(path)
+    assert message_index.build_index(path) == written
+    assert read_index(path) == written
+
+
+@pytest.mark.parametrize('mpoint_id, column', [('CYCLIST HEART RATE', 'heart_rate'),
+                                                ('BIKE GPS LATITUDE', 'latitude')])
+def test_read_window(tmp_path, mpoint_id, column):
+    trek = sample_trek()
+    path = indexed_message(tmp_path, trek)
+    values = getattr(trek, column)
+    valid = hums_message.valid_values(values)
+    entry = next(e for e in read_index(path)['mpoints'] if e['id'] == mpoint_id)
+
+    def expected(first, last):
+        keep = valid & (trek.timestamp >= first) & (trek.timestamp <= last)
+        return trek.timestamp[keep], values[keep].astype(np.float64)
+
+    # edges on trek points, on a checkpoint, and across missing values
+    checkpoint = entry['checkpoints'][2][1]
+    for first, last in ((trek.timestamp[250], trek.timestamp[800]),
+                        (checkpoint, trek.timestamp[-1]),
+                        (trek.timestamp[0], checkpoint),
+                        (trek.timestamp[310], trek.timestamp[410])):
+        window = message_index.read_window(path, mpoint_id, pd.Timestamp(first), pd.Timestamp(last))
+        timestamp, value = expected(first, last)
+        np.testing.assert_array_equal(window['timestamp'].astype(np.int64), timestamp)
+        np.testing.assert_array_equal(window['value'], value)
+
+    # whole mPoint, and empty windows (between two trek points, before the ride)
+    window = message_index.read_window(path, mpoint_id)
+    assert len(window['value']) == valid.sum()
+    between = pd.Timestamp(trek.timestamp[100]) + pd.Timedelta(100, 'ms')
+    for first, last in ((between, between + pd.Timedelta(500, 'ms')),
+                        ('2000-01-01', '2000-01-02')):
+        window = message_index.read_window(path, mpoint_id, first, last)
+        assert len(window['timestamp']) == len(window['value']) == 0
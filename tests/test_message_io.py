@@ -0,0 +1,55 @@
+# coding: utf-8
+
+'''Tests of compressed message files'''
+
+import gzip
+import os
+import shutil
+
+import pytest
+
+import hums_message
+from message_content import read_content
+from message_header import read_header
+from message_io import compression, detect_compression, open_message
+from test_hums_message import HEADER, TRAILER
+from test_message_index import sample_trek
+
+
+@pytest.mark.parametrize('suffix, kind', [('.xml.gz', 'gzip'), ('.xml.zst', 'zstd')])
+def test_compressed_round_trip(tmp_path, suffix, kind):
+    trek = sample_trek()
+    plain = str(tmp_path / 'message.xml')
+    packed = str(tmp_path / ('message' + suffix))
+    hums_message.fast_message(trek, plain, HEADER, TRAILER)
+    hums_message.fast_message(trek, packed, HEADER, TRAILER)
+    assert compression(packed) == detect_compression(packed) == kind
+    assert detect_compression(plain) is None
+    assert os.path.getsize(packed) < os.path.getsize(plain) // 5
+    with open(plain, 'rb') as fd, open_message(packed) as packed_fd:
+        assert packed_fd.read() == fd.read()
+
+    # compression is detected from content, whatever the file name
+    renamed = str(tmp_path / 'renamed.xml')
+    shutil.copy(packed, renamed)
+    assert read_header(renamed) == read_header(plain)
+    heart_rate = read_content(renamed, mpoints=['CYCLIST HEART RATE'])['CYCLIST HEART RATE']
+    assert (heart_rate['value'] == read_content(plain)['CYCLIST HEART RATE']['value']).all()
+
+
+def test_gzip_reproducible(tmp_path):
+    trek = sample_trek()[:100]
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first, second = str(tmp_path / 'a' / 'message.xml.gz'), str(tmp_path / 'b' / 'message.xml.gz')
+    hums_message.fast_message(trek, first, HEADER, TRAILER)
+    hums_message.fast_message(trek, second, HEADER, TRAILER)
+    with open(first, 'rb') as a, open(second, 'rb') as b:
+        assert a.read() == b.read()
+    with gzip.open(first) as fd:
+        assert fd.read(5) == b'<?xml'
+
+
+def test_mode():
+    with pytest.raises(ValueError):
+        open_message('message.xml', 'r')
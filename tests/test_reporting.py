@@ -0,0 +1,114 @@
+# coding: utf-8
+
+'''Tests of deadband reporting and track simplification'''
+
+import numpy as np
+
+import reporting
+from test_message_index import sample_trek
+from trackpoints import MISSING_INT
+
+SECOND = 10 ** 9
+
+
+def sequential_deadband(values, tolerance):
+    '''Deadband reporting by definition: one value at a time, missing values never reported'''
+    mask = np.zeros(len(values), dtype=bool)
+    ref = None
+    for i, x in enumerate(values.tolist()):
+        if x != x or x == MISSING_INT:
+            continue
+        if ref is None or abs(x - ref) > tolerance or (tolerance == 0 and x != ref):
+            mask[i] = True
+            ref = x
+    return mask
+
+
+def test_deadband_changes_only():
+    values = np.array([70, 70, 71, 71, MISSING_INT, 71, 70, 70, 72])
+    timestamp = np.arange(len(values)) * SECOND
+    mask = reporting.deadband_mask(values, timestamp)
+    assert mask.tolist() == [True, False, True, False, False, False, True, False, True]
+
+
+def test_deadband_tolerance():
+    values = np.array([10.0, 10.4, 10.9, 11.2, np.nan, 10.5, 9.9, 12.0, 12.0, 11.1])
+    timestamp = np.arange(len(values)) * SECOND
+    mask = reporting.deadband_mask(values, timestamp, tolerance=1.0)
+    # reference 10.0 -> 11.2 -> 9.9 -> 12.0
+    assert np.flatnonzero(mask).tolist() == [0, 3, 6, 7]
+
+
+def test_deadband_long_band():
+    '''Changes within the deadband for much longer than reporting.SEARCH_BLOCK'''
+    values = np.concatenate((np.tile([0.0, 0.5], 1000), [1.5, 1.0, 2.0], np.tile([0.6, 1.4], 3000)))
+    timestamp = np.arange(len(values)) * SECOND
+    mask = reporting.deadband_mask(values, timestamp, tolerance=1.0)
+    assert np.flatnonzero(mask).tolist() == [0, 2000]
+    assert (mask == sequential_deadband(values, 1.0)).all()
+
+
+def test_deadband_heartbeat():
+    values = np.full(10, 80)
+    values[6:] = 81
+    timestamp = np.arange(len(values)) * 10 * SECOND
+    mask = reporting.deadband_mask(values, timestamp, heartbeat='30s')
+    # repeated 30 s after the first report, then 30 s after the change at 60 s
+    assert np.flatnonzero(mask).tolist() == [0, 3, 6, 9]
+
+
+def test_deadband_ride():
+    '''Tolerances 0 and > 0 on the sample ride, with missing values, match the definition'''
+    trek = sample_trek()
+    for name, tolerance in [('heart_rate', 0), ('heart_rate', 3), ('elevation', 0),
+                            ('elevation', 0.5), ('elevation', 5.0), ('latitude', 1e-4)]:
+        values = getattr(trek, name)
+        mask = reporting.deadband_mask(values, trek.timestamp, tolerance)
+        assert (mask == sequential_deadband(values, tolerance)).all(), (name, tolerance)
+        assert 0 < mask.sum() < len(values)
+
+
+def test_deadband_trek():
+    trek = sample_trek()
+    reduced = reporting.deadband(trek, {'heart_rate': (2, None)})
+    kept = reduced.heart_rate != MISSING_INT
+    assert (kept == sequential_deadband(trek.heart_rate, 2)).all()
+    assert (reduced.heart_rate[kept] == trek.heart_rate[kept]).all()
+    assert reduced.cadence is trek.cadence
+
+
+def test_simplify_straight_line():
+    latitude = np.linspace(43.5, 43.6, 1000)
+    longitude = np.linspace(5.4, 5.5, 1000)
+    mask = reporting.simplify_mask(latitude, longitude, 1.0)
+    # first and last points, and the bounds of the initial segments of douglas_peucker
+    bounds = np.append(np.arange(0, 1000, reporting.BLOCK), 999)
+    assert np.flatnonzero(mask).tolist() == bounds.tolist()
+
+
+def test_simplify_ride():
+    '''First and last positions kept, kept track within tolerance, missing positions not kept'''
+    trek = sample_trek()
+    valid = np.flatnonzero(~np.isnan(trek.latitude))
+    x, y = reporting.local_xy(trek.latitude[valid], trek.longitude[valid])
+    for tolerance in (1.0, 5.0, 20.0):
+        simple = reporting.simplify(trek, tolerance)
+        kept = ~np.isnan(simple.latitude)
+        assert kept[valid[0]] and kept[valid[-1]]
+        assert not kept[300:420].any()
+        assert (np.isnan(simple.longitude) == ~kept).all()
+        assert (np.isnan(simple.elevation) == ~kept | np.isnan(trek.elevation)).all()
+        assert simple.heart_rate is trek.heart_rate
+
+        # distance of every position to the kept segment around it
+        k = np.flatnonzero(kept[valid])
+        assert len(k) < len(valid)
+        segment = np.searchsorted(k, np.arange(len(valid)), side='right') - 1
+        segment = np.minimum(segment, len(k) - 2)
+        x0, y0 = x[k[segment]], y[k[segment]]
+        dx, dy = x[k[segment + 1]] - x0, y[k[segment + 1]] - y0
+        px, py = x - x0, y - y0
+        length2 = dx * dx + dy * dy
+        u = np.clip(np.divide(px * dx + py * dy, length2, out=np.zeros_like(px),
+                              where=length2 > 0), 0, 1)
+        assert np.hypot(px - u * dx, py - u * dy).max() <= tolerance + 1e-6
@@ -0,0 +1,32 @@
+# coding: utf-8
+
+'''Tests of the activity cache'''
+
+import glob
+import pathlib
+
+import numpy as np
+
+import trek_cache
+from fit_reader import write_fit
+from test_fit_reader import ACTIVITY
+
+
+def test_corrupt_entry_rebuilt(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    trek = trek_cache.load_trackpoints(ACTIVITY, cache_dir)
+    entry, = glob.glob(f'{cache_dir}/*.npz')
+    with open(entry, 'r+b') as fd:                      # truncated entry
+        fd.truncate(100)
+    again = trek_cache.load_trackpoints(ACTIVITY, cache_dir)
+    np.testing.assert_array_equal(again.latitude, trek.latitude)
+    assert len(again.time_index) == len(trek)
+    np.testing.assert_array_equal(np.load(entry)['latitude'], trek.latitude)
+
+
+def test_path_input(tmp_path):
+    fit = tmp_path / 'ride.fit'
+    write_fit(str(fit), trek_cache.read_activity(ACTIVITY))
+    for path in (pathlib.Path(ACTIVITY), fit):
+        trek = trek_cache.load_trackpoints(path, str(tmp_path / 'cache'))
+        assert len(trek) == 2695
@@ -0,0 +1,25 @@
+# coding: utf-8
+
+'''Tests of trek_export Arrow conversion'''
+
+import numpy as np
+import pyarrow.parquet as pq
+
+import trek_export
+from trackpoints import MISSING_INT, TrackPoints
+
+
+def test_missing_values(tmp_path):
+    trek = TrackPoints(timestamp=np.arange(3, dtype=np.int64) * 10 ** 9,
+                       latitude=np.array([43.5, np.nan, 43.6]),
+                       longitude=np.array([5.4, np.nan, 5.5]),
+                       elevation=np.array([348.6, 349.0, 350.2], dtype=np.float32),
+                       heart_rate=np.array([114, MISSING_INT, 120], dtype=np.int16),
+                       cadence=np.array([MISSING_INT, 67, 68], dtype=np.int16))
+    path = str(tmp_path / 'trek.parquet')
+    trek_export.to_parquet(trek, path)
+    table = pq.read_table(path)
+    assert table.column('HeartRate').to_pylist() == [114, None, 120]
+    assert table.column('Cadence').to_pylist() == [None, 67, 68]
+    assert table.column('Cadence').type == 'int16'
+    assert np.isnan(table.column('Latitude').to_numpy()[1])
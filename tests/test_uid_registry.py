@@ -0,0 +1,79 @@
+# coding: utf-8
+
+'''Tests of deterministic message uids and of the registry of issued uids'''
+
+import os
+
+import pytest
+
+import hums_message
+import uid_registry
+from test_hums_message import HEADER, TRAILER, sample_trek
+from uid_registry import DuplicateUid, UidRegistry
+
+
+def read_bytes(path):
+    with open(path, 'rb') as fd:
+        return fd.read()
+
+
+def test_deterministic_uid(tmp_path):
+    trek = sample_trek()
+    registry = UidRegistry(str(tmp_path / 'registry.jsonl'))
+    path = str(tmp_path / 'message.xml')
+    uid, written = uid_registry.generate_message(trek, path, HEADER, TRAILER, registry=registry)
+    assert written and uid == 'msg' + hums_message.pos_hash(HEADER['msg_id'])
+    assert read_bytes(path).count(uid.encode()) == 1
+
+    # same uid from another registry and a new creation date, same message content
+    other = str(tmp_path / 'other.xml')
+    header = dict(HEADER, msg_date='2021-01-01')
+    assert uid_registry.generate_message(trek, other, header, TRAILER,
+                                         registry=UidRegistry(str(tmp_path / 'r2.jsonl'))) \
+        == (uid, True)
+    assert read_bytes(other) == read_bytes(path).replace(b'2020-04-16', b'2021-01-01')
+
+
+def test_unchanged_input_skipped(tmp_path):
+    trek = sample_trek()
+    registry_file = str(tmp_path / 'registry.jsonl')
+    path = str(tmp_path / 'message.xml')
+    uid, _ = uid_registry.generate_message(trek, path, HEADER, TRAILER,
+                                           registry=UidRegistry(registry_file))
+    mtime = os.stat(path).st_mtime_ns
+
+    # registry read back from its file, creation time is not part of the input
+    registry = UidRegistry(registry_file)
+    assert uid in registry and len(registry) == 1
+    header = dict(HEADER, msg_time='18:00:00.0Z')
+    assert uid_registry.generate_message(trek, path, header, TRAILER,
+                                         registry=registry) == (uid, False)
+    assert os.stat(path).st_mtime_ns == mtime
+
+    # a deleted message is generated again
+    os.remove(path)
+    assert uid_registry.generate_message(trek, path, HEADER, TRAILER,
+                                         registry=registry) == (uid, True)
+
+
+def test_duplicate_uid(tmp_path):
+    trek = sample_trek()
+    registry = UidRegistry(str(tmp_path / 'registry.jsonl'))
+    first = str(tmp_path / 'first.xml')
+    uid, _ = uid_registry.generate_message(trek, first, HEADER, TRAILER, registry=registry)
+
+    # same msg_id for other trek points
+    changed = sample_trek()
+    changed.heart_rate[0] += 1
+    second = str(tmp_path / 'second.xml')
+    with pytest.raises(DuplicateUid):
+        uid_registry.generate_message(changed, second, HEADER, TRAILER, registry=registry)
+    assert not os.path.exists(second)
+    with pytest.raises(DuplicateUid):
+        UidRegistry(registry.path).check(uid, uid_registry.input_hash(changed, HEADER, TRAILER))
+
+    assert uid_registry.generate_message(changed, second, HEADER, TRAILER, registry=registry,
+                                         replace=True) == (uid, True)
+    registry = UidRegistry(registry.path)
+    assert len(registry) == 1 and registry.uids[uid]['file'] == second
+    assert registry.lookup(uid_registry.input_hash(trek, HEADER, TRAILER)) is None
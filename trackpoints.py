@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Typed columnar storage of bicycle trek points.
+
+Each measurement is stored in its own NumPy array with a fixed dtype, so that
+values are converted from text once (when the GPX file is parsed) and are
+then shared without copy with pandas, HUMS message generation and plotting.
+'''
+
+import numpy as np
+import pandas as pd
+
+# column name: dtype
+SCHEMA = {'timestamp':  np.int64,      # epoch time in nanoseconds (UTC)
+          'latitude':   np.float64,    # degrees
+          'longitude':  np.float64,    # degrees
+          'elevation':  np.float32,    # metres
+          'heart_rate': np.int16,      # beats per minute
+          'cadence':    np.int16,      # revolutions per minute
+          'power':      np.int16,      # watts
+          'atemp':      np.float32,    # air temperature, degrees Celsius
+          'speed':      np.float32}    # metres per second
+
+# value stored for a missing integer measurement (float measurements use NaN)
+MISSING_INT = -1
+
+# dataframe column name of each TrackPoints column
+DF_COLUMNS = {'longitude':  'Longitude',
+              'latitude':   'Latitude',
+              'elevation':  'Elevation',
+              'heart_rate': 'HeartRate',
+              'cadence':    'Cadence',
+              'power':      'Power',
+              'atemp':      'AirTemperature',
+              'speed':      'Speed'}
+
+
+def missing_value(dtype):
+    '''Value stored in a column of type dtype when the measurement is missing'''
+    if np.issubdtype(dtype, np.floating):
+        return np.nan
+    return MISSING_INT
+
+
+class TrackPoints():
+    '''
+    Trek points stored as typed NumPy arrays (see SCHEMA)
+    Input: keyword arguments {column name: array}, all arrays of same length
+    Local attributes:
+        - one array per column: timestamp, latitude, longitude, ...
+        - columns: list of column names
+    '''
+    def __init__(self, **columns):
+        lengths = {len(a) for a in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"TrackPoints columns have different lengths: {lengths}")
+        self.columns = list(columns)
+        for name, array in columns.items():
+            dtype = SCHEMA.get(name, None)
+            setattr(self, name, np.asarray(array, dtype=dtype))
+
+    @classmethod
+    def empty(cls, size=0, columns=None):
+        '''
+        Create TrackPoints with preallocated columns of size trek points
+        columns: list of column names (default: all columns of SCHEMA)
+        '''
+        columns = SCHEMA if columns is None else columns
+        return cls(**{name: np.full(size, missing_value(SCHEMA[name]), dtype=SCHEMA[name])
+                      for name in columns})
+
+    @classmethod
+    def concat(cls, chunks):
+        '''Concatenate a list of TrackPoints chunks having the same columns'''
+        chunks = list(chunks)
+        if not chunks:
+            return cls.empty()
+        return cls(**{name: np.concatenate([getattr(c, name) for c in chunks])
+                      for name in chunks[0].columns})
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, key):
+        '''Select trek points with a slice, a boolean mask or an array of positions'''
+        return TrackPoints(**{name: getattr(self, name)[key] for name in self.columns})
+
+    def truncate(self, size):
+        '''Keep the first size trek points (views on current arrays)'''
+        return self[:size]
+
+    @property
+    def time_index(self):
+        '''Sorted time index of trek points (built once, see TimeIndex)'''
+        if getattr(self, '_time_index', None) is None:
+            self._time_index = TimeIndex(self.timestamp)
+        return self._time_index
+
+    def sort(self):
+        '''
+        Return trek points ordered by timestamp (self if already ordered), with their time index
+        Readers sort trek points once, at ingestion: the time index is built there.
+        '''
+        trek = self if is_sorted(self.timestamp) else self[np.argsort(self.timestamp, kind='stable')]
+        if getattr(trek, '_time_index', None) is None:
+            trek._time_index = TimeIndex(trek.timestamp)
+        return trek
+
+    @property
+    def datetime(self):
+        '''Timestamps as datetime64[ns] (view, no copy)'''
+        return self.timestamp.view('datetime64[ns]')
+
+    def date_time_strings(self):
+        '''
+        Format timestamps once into ISO strings
+        Output: (dates, times) arrays of strings 'YYYY-MM-DD' and 'hh:mm:ss'
+        '''
+        iso = np.datetime_as_string(self.datetime, unit='s')
+        return iso.astype('U10'), np.char.partition(iso, 'T')[:, 2]
+
+    def to_dataframe(self, with_strings=True):
+        '''
+        Expose trek points as a pandas dataframe indexed by timestamp
+        Numeric columns are views on the TrackPoints arrays (no copy).
+        If with_strings is True, string columns Date and Time are added.
+        '''
+        data = {DF_COLUMNS[name]: getattr(self, name)
+                for name in ('longitude', 'latitude', 'elevation')}
+        if with_strings:
+            data['Date'], data['Time'] = self.date_time_strings()
+        for name in self.columns:
+            if name not in ('timestamp', 'longitude', 'latitude', 'elevation'):
+                data[DF_COLUMNS.get(name, name)] = getattr(self, name)
+        df = pd.DataFrame(data, index=pd.DatetimeIndex(self.datetime), copy=False)
+        return df
+
+
+def is_sorted(values):
+    '''True if array values is monotonic increasing'''
+    return bool(np.all(values[1:] >= values[:-1]))
+
+
+def to_ns(t):
+    '''
+    Convert a time (ISO string, datetime, pandas Timestamp, datetime64 or epoch
+    nanoseconds) or an array of times to epoch nanoseconds (UTC)
+    '''
+    if isinstance(t, (int, np.integer)):
+        return np.int64(t)
+    if isinstance(t, np.ndarray) and t.dtype.kind in 'iu':
+        return t.astype(np.int64)
+    if isinstance(t, str):
+        t = pd.Timestamp(t)
+    t = pd.to_datetime(t)
+    if getattr(t, 'tz', None) is not None:
+        t = t.tz_convert('UTC').tz_localize(None)
+    return np.asarray(t, dtype='datetime64[ns]').view(np.int64)
+
+
+class TimeIndex():
+    '''
+    Monotonic index of trek point timestamps (epoch nanoseconds, int64)
+    Input: sorted array of timestamps (see TrackPoints.sort)
+    Lookups use binary search (O(log n)): times can be given as ISO strings,
+    datetimes, pandas Timestamps, datetime64 or epoch nanoseconds.
+    '''
+    def __init__(self, timestamp):
+        self.values = np.asarray(timestamp, dtype=np.int64)
+        if not is_sorted(self.values):
+            raise ValueError("TimeIndex timestamps must be sorted, use TrackPoints.sort()")
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def start(self):
+        '''first timestamp as datetime64[ns]'''
+        return self.values[0].view('datetime64[ns]')
+
+    @property
+    def end(self):
+        '''last timestamp as datetime64[ns]'''
+        return self.values[-1].view('datetime64[ns]')
+
+    def slice(self, start=None, end=None, inclusive=True):
+        '''
+        Positions of trek points recorded between start and end
+        Inputs:
+            ** start, end: time bounds (None for no bound)
+            ** inclusive: if False, trek points recorded at start or end are excluded
+        Output: python slice usable on TrackPoints, arrays and df.iloc
+        '''
+        i = 0 if start is None else \
+            int(np.searchsorted(self.values, to_ns(start), 'left' if inclusive else 'right'))
+        j = len(self.values) if end is None else \
+            int(np.searchsorted(self.values, to_ns(end), 'right' if inclusive else 'left'))
+        return slice(i, max(i, j))
+
+    def nearest(self, t):
+        '''Position of the trek point nearest to time t (t can be an array of times)'''
+        t = to_ns(t)
+        j = np.clip(np.searchsorted(self.values, t), 1, len(self.values) - 1)
+        before, after = self.values[j - 1], self.values[j]
+        pos = np.where(t - before <= after - t, j - 1, j)
+        if len(self.values) == 1:
+            pos = np.zeros_like(pos)
+        return int(pos) if np.ndim(pos) == 0 else pos
+
+    def gaps(self, min_gap='2s'):
+        '''
+        Interruptions of recording longer than min_gap
+        Input: min_gap as pandas timedelta string, timedelta or nanoseconds
+        Output: dataframe (position, start, end, duration) of each gap, position
+                being the first trek point recorded after the gap
+        '''
+        min_gap = pd.to_timedelta(min_gap).value
+        step = np.diff(self.values)
+        pos = np.flatnonzero(step > min_gap) + 1
+        return pd.DataFrame({'position': pos,
+                             'start': self.values[pos - 1].view('datetime64[ns]'),
+                             'end': self.values[pos].view('datetime64[ns]'),
+                             'duration': step[pos - 1].view('timedelta64[ns]')})
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''
+    Distance in km between points (lat1, lon1) and (lat2, lon2) given in degrees
+    Inputs can be scalars or NumPy arrays. This uses the haversine formula,
+    which remains a good numerical computation even at small distances.
+    '''
+    R = 6371    # Radius of Earth in km
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def trek_distance(trek):
+    '''Length in km of each step between consecutive trek points (first step is NaN)'''
+    d = np.full(len(trek), np.nan)
+    d[1:] = haversine(trek.latitude[:-1], trek.longitude[:-1],
+                      trek.latitude[1:], trek.longitude[1:])
+    return d
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Cache of parsed activities (GPX or FIT files).
+
+Typed columns of a parsed activity are stored in a NumPy .npz file named
+after the hash of the activity file content, the parser version and the
+extracted fields. Reruns on an unchanged file load the columns directly,
+without XML parsing. The cache folder is bounded in size: least recently
+used entries are deleted first.
+'''
+
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+import fit_reader
+import gpx_reader
+from file_utils import file_hash
+from trackpoints import TrackPoints
+
+CACHE_DIR = '.trek_cache'
+MAX_BYTES = 512 * 1024 * 1024       # maximum size of cache folder
+
+
+def read_activity(path, fields=gpx_reader.DEFAULT_FIELDS):
+    '''Read a GPX or FIT (*.fit) activity file into TrackPoints'''
+    if os.fspath(path).lower().endswith('.fit'):
+        return fit_reader.read_fit(path, fields=fields)
+    return gpx_reader.read_trackpoints(path, fields=fields)
+
+
+def cache_key(path, fields=gpx_reader.DEFAULT_FIELDS):
+    '''Cache key of an activity file: hash of content, parser versions and fields'''
+    h = hashlib.blake2b(digest_size=20)
+    h.update(file_hash(path).encode())
+    h.update(gpx_reader.PARSER_VERSION.encode())
+    h.update(fit_reader.PARSER_VERSION.encode())
+    h.update(','.join(fields).encode())
+    return h.hexdigest()
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    '''Delete least recently used entries until cache folder size is below max_bytes'''
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.npz'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:       # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def load_trackpoints(path, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES,
+                     fields=gpx_reader.DEFAULT_FIELDS):
+    '''
+    Read a GPX or FIT activity file through the cache
+    Inputs:
+        ** path: pathname of GPX or FIT file
+        ** cache_dir: cache folder (created if needed)
+        ** max_bytes: maximum size of cache folder
+        ** fields: columns to extract (see gpx_reader.FIELDS)
+    Output: TrackPoints, with its time index
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, cache_key(path, fields) + '.npz')
+    try:
+        with np.load(entry) as data:
+            trek = TrackPoints(**{name: data[name] for name in data.files}).sort()
+        os.utime(entry)                     # mark entry as recently used
+    except (FileNotFoundError, ValueError, OSError, zipfile.BadZipFile):     # missing or corrupt
+        trek = read_activity(path, fields=fields)
+        # temporary file unique to this process: processes loading the same activity at the
+        # same time write their own file, the last rename wins with the same content
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                np.savez(out, **{name: getattr(trek, name) for name in trek.columns})
+            os.replace(tmp, entry)
+        except OSError:                     # entry written by another process: cache hit
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        evict(cache_dir, max_bytes)
+    return trek
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Export of trek points to Excel, Parquet and Feather files.
+
+Excel workbooks are written with openpyxl in write-only mode: rows are
+streamed to the file chunk by chunk and a new sheet is started when the
+Excel row limit is reached. Parquet and Feather files are written with
+pyarrow from the typed columns of TrackPoints, without conversion to text.
+'''
+
+import numpy as np
+
+from trackpoints import DF_COLUMNS
+
+EXCEL_MAX_ROWS = 1048576            # rows per sheet, header row included
+CHUNK_ROWS = 50000                  # trek points converted at once
+
+
+def _excel_columns(trek):
+    '''Names of exported columns, same order as the trek dataframe (see TrackPoints.to_dataframe)'''
+    names = ['longitude', 'latitude', 'elevation', 'Date', 'Time']
+    names += [n for n in trek.columns if n not in ('timestamp', 'longitude', 'latitude', 'elevation')]
+    return names
+
+
+def _excel_values(array):
+    '''Column values as python objects, missing values as empty cells'''
+    if np.issubdtype(array.dtype, np.floating):
+        return [None if v != v else v for v in array.tolist()]
+    if np.issubdtype(array.dtype, np.integer):
+        return [None if v < 0 else v for v in array.tolist()]
+    return array.tolist()
+
+
+def to_excel(trek, path, sheet_name='Sheet1', max_rows=EXCEL_MAX_ROWS, chunk_rows=CHUNK_ROWS):
+    '''
+    Write trek points into an Excel file in streaming (write-only) mode
+    Inputs:
+        ** trek: TrackPoints
+        ** path: pathname of xlsx file
+        ** sheet_name: name of first sheet, next sheets are named sheet_name_2, ...
+        ** max_rows: maximum number of rows per sheet (header row included)
+        ** chunk_rows: number of trek points converted to rows at once
+    Output: number of sheets written
+    '''
+    from openpyxl import Workbook    # pip install openpyxl
+
+    names = _excel_columns(trek)
+    header = [DF_COLUMNS.get(name, name) for name in names]
+    per_sheet = max_rows - 1
+    wb = Workbook(write_only=True)
+    n_sheets = max(1, -(-len(trek) // per_sheet))
+    for s in range(n_sheets):
+        ws = wb.create_sheet(sheet_name if s == 0 else f'{sheet_name}_{s + 1}')
+        ws.append(header)
+        end = min(len(trek), (s + 1) * per_sheet)
+        for start in range(s * per_sheet, end, chunk_rows):
+            chunk = trek[start:min(end, start + chunk_rows)]
+            dates, times = chunk.date_time_strings()
+            columns = {'Date': dates, 'Time': times}
+            values = [_excel_values(columns[name] if name in columns else getattr(chunk, name))
+                      for name in names]
+            for row in zip(*values):
+                ws.append(row)
+    wb.save(path)
+    return n_sheets
+
+
+def to_arrow(trek):
+    '''
+    pyarrow Table sharing memory with the numeric columns of trek points
+    Missing integer values (trackpoints.MISSING_INT) are null, missing float values stay NaN.
+    '''
+    import pyarrow as pa            # pip install pyarrow
+
+    arrays, names = [], []
+    for name in trek.columns:
+        values = getattr(trek, name)
+        if name == 'timestamp':
+            arrays.append(pa.array(values, type=pa.int64()).view(pa.timestamp('ns', tz='UTC')))
+        elif np.issubdtype(values.dtype, np.integer):
+            arrays.append(pa.array(values, mask=values < 0))
+        else:
+            arrays.append(pa.array(values))
+        names.append(DF_COLUMNS.get(name, name))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def to_parquet(trek, path, row_group_rows=CHUNK_ROWS, compression='snappy'):
+    '''
+    Write trek points into a Parquet file, one row group every row_group_rows trek points
+    Inputs:
+        ** trek: TrackPoints
+        ** path: pathname of parquet file
+        ** row_group_rows: number of trek points per row group
+        ** compression: parquet compression codec
+    '''
+    import pyarrow.parquet as pq    # pip install pyarrow
+
+    table = to_arrow(trek)
+    with pq.ParquetWriter(path, table.schema, compression=compression) as writer:
+        for batch in table.to_batches(max_chunksize=row_group_rows):
+            writer.write_batch(batch)
+
+
+def to_feather(trek, path, compression='lz4'):
+    '''
+    Write trek points into a Feather (Arrow IPC) file
+    Inputs:
+        ** trek: TrackPoints
+        ** path: pathname of feather file
+        ** compression: 'lz4', 'zstd' or 'uncompressed'
+    '''
+    import pyarrow.feather as feather     # pip install pyarrow
+
+    feather.write_feather(to_arrow(trek), path, compression=compression,
+                          chunksize=CHUNK_ROWS)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Registry of issued S5000F message uids.
+
+Message uids are deterministic (keyed BLAKE2 digest of msg_id, see
+hums_message.pos_hash). The registry records, for each issued uid, the hash of
+the message input (trek points and message parameters) and the message file.
+It is stored as JSON lines (one record appended per issued message) and held
+in memory as two dictionaries, so that:
+    - a message whose input did not change is not generated again
+    - a uid issued for another input (duplicate msg_id) is detected
+both in O(1).
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import hums_message
+from hums_message import MPOINTS, SERIAL_PV
+
+REGISTRY = '.uid_registry.jsonl'
+
+# header entries which do not change message content (date and time of message creation)
+VOLATILE = ('msg_date', 'msg_time')
+
+
+class DuplicateUid(ValueError):
+    '''uid already issued for a message with another input'''
+
+
+def input_hash(trek, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS):
+    '''
+    BLAKE2b hex digest of message input: trek points and message parameters
+    Message creation date and time (VOLATILE header entries) are not hashed.
+    '''
+    h = hashlib.blake2b(digest_size=20)
+    parameters = {'header': {k: v for k, v in header.items() if k not in VOLATILE},
+                  'trailer': trailer, 'serial_pv': serial_pv, 'mpoints': mpoints}
+    h.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    for name in trek.columns:
+        h.update(name.encode('utf-8'))
+        h.update(np.ascontiguousarray(getattr(trek, name)).data)
+    return h.hexdigest()
+
+
+class UidRegistry():
+    '''
+    Registry of issued message uids (see module doc)
+    Input: path of registry file (created at first issued uid)
+    Local attributes:
+        - uids: dictionary {uid: record}
+        - inputs: dictionary {input hash: record}
+    A record is a dictionary (uid, input, file, created).
+    '''
+    def __init__(self, path=REGISTRY):
+        self.path = path
+        self.uids = {}
+        self.inputs = {}
+        if os.path.exists(path):
+            with open(path) as fd:
+                for line in fd:
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    def _add(self, record):
+        previous = self.uids.get(record['uid'])
+        if previous is not None:
+            self.inputs.pop(previous['input'], None)
+        self.uids[record['uid']] = record
+        self.inputs[record['input']] = record
+
+    def __contains__(self, uid):
+        return uid in self.uids
+
+    def __len__(self):
+        return len(self.uids)
+
+    def lookup(self, input_hash):
+        '''Record of message generated from input_hash, None if there is none'''
+        return self.inputs.get(input_hash)
+
+    def check(self, uid, input_hash):
+        '''Raise DuplicateUid if uid was issued for a message with another input'''
+        previous = self.uids.get(uid)
+        if previous is not None and previous['input'] != input_hash:
+            raise DuplicateUid(f"uid {uid} already issued for {previous['file']} "
+                               f"(input {previous['input']})")
+
+    def issue(self, uid, input_hash, file=None, replace=False):
+        '''
+        Record uid issued for a message generated from input_hash into file
+        Raise DuplicateUid if uid was issued for another input, unless replace is True.
+        Output: record
+        '''
+        if not replace:
+            self.check(uid, input_hash)
+        record = {'uid': uid, 'input': input_hash, 'file': file,
+                  'created': pd.Timestamp.now().isoformat(timespec='seconds')}
+        with open(self.path, 'a') as fd:
+            fd.write(json.dumps(record) + '\n')
+        self._add(record)
+        return record
+
+
+def generate_message(trek, path, header, trailer, serial_pv=SERIAL_PV, mpoints=MPOINTS,
+                     registry=None, replace=False, writer=hums_message.fast_message):
+    '''
+    Write message UC50902 for trek points unless the same message was already generated
+    Inputs:
+        ** trek, path, header, trailer, serial_pv, mpoints: see hums_message.fast_message
+        ** registry: UidRegistry (default: registry of file REGISTRY)
+        ** replace: if True, a uid already issued for another input is issued again
+        ** writer: message writer (fast_message, stream_message, ...)
+    Output: (message uid, True if message was written, False if it was skipped)
+    Raise DuplicateUid if msg_id gives a uid already issued for another input.
+    '''
+    registry = UidRegistry() if registry is None else registry
+    digest = input_hash(trek, header, trailer, serial_pv, mpoints)
+    record = registry.lookup(digest)
+    if record is not None and record['file'] == path and os.path.exists(path):
+        return record['uid'], False
+    msg_uid = 'msg' + hums_message.pos_hash(header['msg_id'])
+    if not replace:
+        registry.check(msg_uid, digest)
+    writer(trek, path, header, trailer, serial_pv, mpoints)
+    registry.issue(msg_uid, digest, path, replace=True)
+    return msg_uid, True